@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.db import connections
+
+
+class ConnectionHealthCheckMiddleware:
+    """Проверяет постоянные соединения с БД (CONN_MAX_AGE > 0) перед обработкой запроса.
+
+    В Django 3.1 нет CONN_HEALTH_CHECKS: соединение, закрытое сервером, pgbouncer
+    или сетью, пока оно простаивало, обнаруживается только ошибкой первого запроса.
+    Поэтому соединение, которое простаивало дольше DB_HEALTH_CHECK_IDLE секунд,
+    проверяется запросом SELECT 1 и при ошибке закрывается — Django откроет новое.
+    Соединения, которые используются постоянно, не проверяются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        idle = settings.DB_HEALTH_CHECK_IDLE
+        if idle is not None:
+            now = time.monotonic()
+            for conn in connections.all():
+                if conn.connection is None or conn.in_atomic_block:
+                    continue
+                last_used = getattr(conn, "_last_request_finished", None)
+                if last_used is not None and now - last_used > idle and not conn.is_usable():
+                    conn.close()
+
+        response = self.get_response(request)
+
+        now = time.monotonic()
+        for conn in connections.all():
+            conn._last_request_finished = now
+
+        return response
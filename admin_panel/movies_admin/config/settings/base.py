@@ -37,10 +37,12 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
-    "movies",
+    "movies.apps.MoviesConfig",
 ]
 
 MIDDLEWARE = [
+    "movies.metrics.MetricsMiddleware",
+    "config.middleware.ConnectionHealthCheckMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -48,7 +50,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "debug_toolbar.middleware.DebugToolbarMiddleware"
+    "movies.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -75,6 +77,26 @@ INTERNAL_IPS = [
     "127.0.0.1",
 ]
 
+# Профилирование запросов (см. movies.profiling.ProfilingMiddleware): доля случайно
+# профилируемых запросов, cprofile (pstats) или sampler (свёрнутые стеки для flamegraph),
+# куда сохранять профили и сколько последних хранить
+PROFILING_SAMPLE_RATE = 0.0
+PROFILING_MODE = "cprofile"
+PROFILING_SAMPLE_INTERVAL = 0.005
+PROFILING_DIR = "/var/movies/profiles/"
+PROFILING_MAX_PROFILES = 200
+# сколько секунд действует токен из make_profile_token для заголовка X-Profile
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+# сохранять ли параметры запросов к БД в профиль: в них бывают персональные данные;
+# параметры запросов к сессиям и пользователям не сохраняются никогда
+PROFILING_LOG_PARAMS = False
+
+# Токен для /metrics (заголовок Authorization: Bearer <token>), None — без проверки
+METRICS_TOKEN = None
+# Каталог, через который воркеры gunicorn складывают метрики для /metrics;
+# None — каждый процесс отдаёт только свои метрики
+METRICS_DIR = None
+
 
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
@@ -87,11 +109,69 @@ DATABASES = {
         "PASSWORD": "123",
         "HOST": "db",
         "PORT": "5432",
+        # сколько секунд держать соединение открытым между запросами, 0 — закрывать
+        # после каждого запроса
+        "CONN_MAX_AGE": 0,
     }
 }
 
+# Соединение, которое простаивало дольше стольких секунд, перед запросом проверяется
+# через SELECT 1 (см. config.middleware.ConnectionHealthCheckMiddleware), None — не проверять
+DB_HEALTH_CHECK_IDLE = 30
+
 CONTENT_SCHEMA = "content"
 
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # готовые ответы API фильмов, LocMemCache вытесняет записи по LRU
+    "movies_api": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "movies_api",
+        "TIMEOUT": 60 * 5,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+# Алиас кэша ответов /api/v1/movies/, None отключает кэширование
+MOVIES_API_CACHE = "movies_api"
+
+# Отдавать фильмы из заранее собранной таблицы film_work_document вместо агрегации
+# по связанным таблицам на каждый запрос
+MOVIES_API_USE_DOCUMENTS = False
+
+# Когда пересобирать документы изменившихся фильмов (только при MOVIES_API_USE_DOCUMENTS):
+# background — в фоновом потоке воркера, commit — сразу после фиксации транзакции, в том же
+# запросе. Без MOVIES_API_USE_DOCUMENTS документы (и поиск по ним) обновляет только команда
+# refresh_documents, её нужно запускать по расписанию
+MOVIES_API_DOCUMENTS_REFRESH = "background"
+
+# Как собирать списки людей и жанров фильма (см. movies.documents.aggregate_films):
+# subquery — отдельным подзапросом на каждый список, join — одним GROUP BY по всем связям
+MOVIES_API_AGGREGATION = "subquery"
+
+# Конфигурация полнотекстового поиска PostgreSQL для /api/v1/movies/search/ и админки.
+# При изменении нужно пересобрать документы командой refresh_documents
+MOVIES_SEARCH_CONFIG = "english"
+
+# Кодировщик JSON для API: auto — orjson, если он установлен, иначе стандартный json;
+# orjson или stdlib — принудительно
+MOVIES_API_SERIALIZER = "auto"
+
+# Кто кодирует документы фильмов в JSON: python — сериализатор MOVIES_API_SERIALIZER,
+# sql — PostgreSQL (row_to_json), Python только склеивает готовые байты
+MOVIES_API_RENDERING = "python"
+
+# Сколько секунд хранить количество фильмов для /api/v1/movies/?cursor=&count=cached
+MOVIES_API_COUNT_CACHE_TIMEOUT = 60
+
+# Сколько фильмов можно запросить за раз через /api/v1/movies/batch/
+MOVIES_API_BATCH_MAX_IDS = 100
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -4,3 +4,4 @@ from .base import *
 DEBUG = True
 
 INSTALLED_APPS.append("debug_toolbar")
+MIDDLEWARE.append("debug_toolbar.middleware.DebugToolbarMiddleware")
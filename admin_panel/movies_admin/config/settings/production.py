@@ -1,4 +1,28 @@
 # flake8: noqa
+import os
+
 from .base import *
 
-# Пока оставим его пустым
+# Кэш ответов API можно вынести в Redis, общий для всех воркеров (нужен пакет django-redis)
+if os.environ.get("MOVIES_API_CACHE_REDIS_URL"):
+    CACHES["movies_api"] = {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": os.environ["MOVIES_API_CACHE_REDIS_URL"],
+        "TIMEOUT": 60 * 5,
+    }
+
+# Подключение к БД, в том числе через pgbouncer (DB_HOST=pgbouncer)
+DATABASES["default"]["HOST"] = os.environ.get("DB_HOST", DATABASES["default"]["HOST"])
+DATABASES["default"]["PORT"] = os.environ.get("DB_PORT", DATABASES["default"]["PORT"])
+# Постоянные соединения: каждый поток воркера gunicorn переиспользует своё соединение
+DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get("DB_CONN_MAX_AGE", 60))
+# pgbouncer в режиме transaction не поддерживает курсоры WITH HOLD, которые Django
+# открывает для iterator() вне транзакции. Все iterator() проекта вызываются внутри
+# transaction.atomic(), поэтому серверные курсоры по умолчанию остаются включены
+DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = (
+    os.environ.get("DB_DISABLE_SERVER_SIDE_CURSORS", "") == "1"
+)
+
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN") or None
+METRICS_DIR = os.environ.get("METRICS_DIR") or None
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
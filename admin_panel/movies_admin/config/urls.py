@@ -13,12 +13,23 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-import debug_toolbar
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 
+from movies.metrics import metrics_view
+from movies.profiling import profile_download, profile_list
+
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path("__debug__/", include(debug_toolbar.urls)),
-    path("api/", include("movies.api.urls"))
+    path("api/", include("movies.api.urls")),
+    path("metrics", metrics_view),
+    path("profiles/", profile_list),
+    path("profiles/<str:name>", profile_download),
 ]
+
+# панель отладки подключена только в config.settings.dev
+if "debug_toolbar" in settings.INSTALLED_APPS:
+    import debug_toolbar
+
+    urlpatterns.append(path("__debug__/", include(debug_toolbar.urls)))
@@ -0,0 +1,21 @@
+# Настройки gunicorn: gunicorn -c gunicorn.conf.py config.wsgi:application
+import multiprocessing
+import os
+import shutil
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+# потоки внутри воркера ждут БД параллельно; у каждого потока своё постоянное
+# соединение, поэтому всего соединений workers * threads — их принимает pgbouncer
+worker_class = "gthread"
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+keepalive = 5
+# перезапуск воркеров понемногу ограничивает рост памяти
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 5000))
+max_requests_jitter = max_requests // 10
+
+
+def on_starting(server):
+    # метрики прошлого запуска не должны попасть в /metrics нового
+    if os.environ.get("METRICS_DIR"):
+        shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
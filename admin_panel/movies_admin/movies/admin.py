@@ -1,19 +1,67 @@
+from django.conf import settings
 from django.contrib import admin
-from .models import FilmWork, Person, Genre
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+
+from .documents import search_documents
+from .models import FilmWork, FilmWorkDocument, Person, Genre
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор списка админки, который для таблицы без фильтров берёт оценку числа
+    строк из pg_class.reltuples вместо COUNT(*) по всей таблице. Для небольших таблиц
+    и отфильтрованных списков количество считается точно.
+    """
+
+    # меньше стольких строк COUNT(*) достаточно быстрый
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, "query", None)
+        if query is not None and not query.where:
+            estimate = self.estimate(self.object_list.model)
+            if estimate >= self.estimate_threshold:
+                return estimate
+
+        return super().count
+
+    @staticmethod
+    def estimate(model) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [connection.ops.quote_name(model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+
+        # -1 или 0 — таблицу ещё не анализировали
+        return row[0] if row else 0
+
+
+class PerformanceAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # не считать всю таблицу ради «N из M» при поиске и фильтрах
+    show_full_result_count = False
 
 
 class PersonInLineAdmin(admin.TabularInline):
     model = FilmWork.persons.through
     extra = 0
+    # поле выбора с поиском вместо <select> со всеми людьми или фильмами:
+    # в форму попадают только уже выбранные значения
+    autocomplete_fields = ("film_work", "person")
 
 
 class GenreInLineAdmin(admin.TabularInline):
     model = FilmWork.genres.through
     extra = 0
+    autocomplete_fields = ("film_work", "genre")
 
 
 @admin.register(FilmWork)
-class FilmWorkAdmin(admin.ModelAdmin):
+class FilmWorkAdmin(PerformanceAdmin):
     # отображение полей в списке
     list_display = ("title", "type", "creation_date", "rating")
     # порядок следования полей в форме создания/редактирования
@@ -29,12 +77,29 @@ class FilmWorkAdmin(admin.ModelAdmin):
 
     inlines = (PersonInLineAdmin, GenreInLineAdmin)
 
-    # поиск по полям
-    search_fields = ("title", "description", "type", "genres")
+    # в списке поиск идёт по документам фильмов (см. get_search_results), а в
+    # автодополнении и без документов — icontains по названию и описанию, оба покрыты
+    # триграммными индексами. Жанры не ищутся: соединение с ними дублирует строки
+    search_fields = ("title", "description")
+
+    def get_search_results(self, request, queryset, search_term):
+        # автодополнение ищет по началу названия, которое полнотекстовый поиск не находит,
+        # а без документов (MOVIES_API_USE_DOCUMENTS выключен) они могут быть устаревшими
+        if (
+            not search_term
+            or request.path.endswith("autocomplete/")
+            or not settings.MOVIES_API_USE_DOCUMENTS
+            or not FilmWorkDocument.objects.exists()
+        ):
+            return super().get_search_results(request, queryset, search_term)
+
+        # полнотекстовый поиск по документам фильмов вместо icontains по каждому полю
+        found = search_documents(search_term).values("id")
+        return queryset.filter(id__in=found), False
 
 
 @admin.register(Person)
-class PersonAdmin(admin.ModelAdmin):
+class PersonAdmin(PerformanceAdmin):
     # отображение полей в списке
     list_display = ("full_name", "birth_date")
     # порядок следования полей в форме создания/редактирования
@@ -45,12 +110,12 @@ class PersonAdmin(admin.ModelAdmin):
 
     inlines = (PersonInLineAdmin, )
 
-    # поиск по полям
-    search_fields = ("full_name", "birth_date")
+    # поиск по полям, UPPER(full_name) покрыт триграммным индексом
+    search_fields = ("full_name",)
 
 
 @admin.register(Genre)
-class GenreAdmin(admin.ModelAdmin):
+class GenreAdmin(PerformanceAdmin):
     # отображение полей в списке
     list_display = ("name", "description")
     # порядок следования полей в форме создания/редактирования
@@ -0,0 +1,121 @@
+import hashlib
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class ResponseCache:
+    """Кэш готовых JSON-ответов API фильмов.
+
+    Кроме ответов целиком хранятся закодированные документы отдельных фильмов, из которых
+    собираются страницы списка без повторного кодирования.
+
+    Ключ ответа содержит версию: общую для всех страниц списка и отдельную для каждого
+    фильма. При изменении фильма увеличиваются его версия и версия списка, поэтому
+    старые ответы просто перестают читаться и вытесняются по TTL или LRU бэкенда.
+    Бэкенд и TTL задаются алиасом MOVIES_API_CACHE в настройке CACHES.
+    """
+
+    LIST_VERSION_KEY = "movies:version:list"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.MOVIES_API_CACHE is not None
+
+    @property
+    def backend(self):
+        return caches[settings.MOVIES_API_CACHE]
+
+    @staticmethod
+    def _film_version_key(pk) -> str:
+        return f"movies:version:film:{pk}"
+
+    @staticmethod
+    def _params_hash(params) -> str:
+        query = "&".join(f"{key}={value}" for key, value in sorted(params.lists()))
+
+        return hashlib.md5(query.encode()).hexdigest()
+
+    def list_key(self, path: str, params) -> str:
+        """Ключ ответа со списком фильмов. В ключ входит путь: у разных списков
+        (например, каталога и поиска) одинаковые параметры дают разные ответы."""
+        version = self.backend.get(self.LIST_VERSION_KEY, 0)
+        path_hash = hashlib.md5(path.encode()).hexdigest()
+
+        return f"movies:list:{version}:{path_hash}:{self._params_hash(params)}"
+
+    def detail_key(self, pk, params) -> str:
+        version = self.backend.get(self._film_version_key(pk), 0)
+
+        return f"movies:detail:{pk}:{version}:{self._params_hash(params)}"
+
+    def document_keys(self, ids: List, fields: Sequence[str]) -> Dict:
+        """Ключи документов фильмов по id. Их нужно получить до чтения фильмов из БД
+        и по ним же сохранить документы: если версия фильма сменится в промежутке,
+        старый документ попадёт под старую версию, а не под новую."""
+        versions = self.backend.get_many([self._film_version_key(pk) for pk in ids])
+        # документы с разным набором полей (?fields=) и способом кодирования хранятся отдельно
+        variant = hashlib.md5(
+            ",".join([settings.MOVIES_API_RENDERING, *fields]).encode()
+        ).hexdigest()
+
+        return {
+            pk: f"movies:document:{pk}:{versions.get(self._film_version_key(pk), 0)}:{variant}"
+            for pk in ids
+        }
+
+    def get_documents(self, keys: Dict) -> Dict:
+        """Закодированные документы фильмов из keys (см. document_keys), которые есть
+        в кэше, по id."""
+        found = self.backend.get_many(list(keys.values()))
+
+        return {pk: found[key] for pk, key in keys.items() if key in found}
+
+    def set_documents(self, documents: Dict, keys: Dict):
+        self.backend.set_many({keys[pk]: content for pk, content in documents.items()})
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> Optional[bytes]:
+        content = self.backend.get(key)
+        self._count(content is not None)
+
+        return content
+
+    def set(self, key: str, content: bytes):
+        self.backend.set(key, content)
+
+    def _bump(self, key: str):
+        try:
+            self.backend.incr(key)
+        except ValueError:
+            # ключа ещё нет или он вытеснен: любая новая версия отличается от 0
+            self.backend.set(key, 1, timeout=None)
+
+    def invalidate_films(self, ids: Iterable):
+        """Сбрасывает ответы по изменившимся фильмам и все страницы списка."""
+        if not self.enabled:
+            return
+
+        for pk in set(ids):
+            self._bump(self._film_version_key(pk))
+        self._bump(self.LIST_VERSION_KEY)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,91 @@
+import hashlib
+from datetime import datetime
+from typing import Optional, Tuple
+
+from django.db import connection
+
+from movies.models import FilmWork, FilmWorkChange, Genre, GenreFilmWork, Person, PersonFilmWork
+
+
+def _table(model) -> str:
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def _etag(*parts) -> str:
+    return hashlib.md5(":".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _query_string(request) -> str:
+    return "&".join(f"{key}={value}" for key, value in sorted(request.GET.lists()))
+
+
+def catalogue_state(request) -> Tuple[Optional[datetime], str]:
+    """Время последнего изменения каталога и ETag для списка фильмов.
+
+    Считается одним запросом по индексам, без агрегации по связям и без COUNT(*).
+    Удаление фильма не меняет max(modified), поэтому в ETag входит последняя запись
+    журнала изменений film_work_change, которая добавляется и при удалении.
+    Изменения связей учтены через film_work.modified (см. movies.signals).
+    Результат запоминается в request, так как condition вызывает обе функции.
+    """
+    if not hasattr(request, "_catalogue_state"):
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+            SELECT
+                (SELECT max(modified) FROM {_table(FilmWork)}),
+                (SELECT max(id) FROM {_table(FilmWorkChange)}),
+                (SELECT max(modified) FROM {_table(Person)}),
+                (SELECT max(modified) FROM {_table(Genre)})
+            """)
+            film_modified, last_change, person_modified, genre_modified = cursor.fetchone()
+
+        modified = [m for m in (film_modified, person_modified, genre_modified) if m is not None]
+        last_modified = max(modified) if modified else None
+        etag = _etag(last_modified, last_change, _query_string(request))
+        request._catalogue_state = last_modified, etag
+
+    return request._catalogue_state
+
+
+def film_state(request, pk) -> Tuple[Optional[datetime], Optional[str]]:
+    """Время последнего изменения фильма, его людей и жанров и ETag для ответа по фильму."""
+    if not hasattr(request, "_film_state"):
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+            SELECT
+                fw.modified,
+                (SELECT max(p.modified) FROM {_table(PersonFilmWork)} pfw
+                 JOIN {_table(Person)} p ON p.id = pfw.person_id
+                 WHERE pfw.film_work_id = fw.id),
+                (SELECT max(g.modified) FROM {_table(GenreFilmWork)} gfw
+                 JOIN {_table(Genre)} g ON g.id = gfw.genre_id
+                 WHERE gfw.film_work_id = fw.id)
+            FROM {_table(FilmWork)} fw
+            WHERE fw.id = %s
+            """, [pk])
+            row = cursor.fetchone()
+
+        if row is None:
+            # фильма нет: ответ 404 не кэшируется и не сравнивается
+            request._film_state = None, None
+        else:
+            last_modified = max(m for m in row if m is not None)
+            request._film_state = last_modified, _etag(pk, last_modified, _query_string(request))
+
+    return request._film_state
+
+
+def list_last_modified(request, *args, **kwargs):
+    return catalogue_state(request)[0]
+
+
+def list_etag(request, *args, **kwargs):
+    return catalogue_state(request)[1]
+
+
+def detail_last_modified(request, pk, *args, **kwargs):
+    return film_state(request, pk)[0]
+
+
+def detail_etag(request, pk, *args, **kwargs):
+    return film_state(request, pk)[1]
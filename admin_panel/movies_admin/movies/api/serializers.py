@@ -0,0 +1,111 @@
+import json
+from typing import Dict, Iterable
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import FloatField, QuerySet
+from django.http import HttpResponse
+
+from movies.metrics import timed
+
+try:
+    import orjson
+except ImportError:  # orjson — необязательная зависимость
+    orjson = None
+
+SERIALIZERS = ("auto", "orjson", "stdlib")
+
+_encoder = DjangoJSONEncoder()
+
+
+def _use_orjson() -> bool:
+    mode = settings.MOVIES_API_SERIALIZER
+    if mode == "orjson" and orjson is None:
+        raise ImportError("MOVIES_API_SERIALIZER = 'orjson', но пакет orjson не установлен")
+
+    return orjson is not None and mode != "stdlib"
+
+
+@timed("serialize")
+def dumps(data) -> bytes:
+    """Кодирует данные в JSON. Если установлен orjson, используется он, иначе json
+    из стандартной библиотеки с DjangoJSONEncoder. Типы, которые orjson не знает
+    (например, ленивые строки перевода), кодируются через DjangoJSONEncoder.
+    """
+    if _use_orjson():
+        return orjson.dumps(data, default=_encoder.default)
+
+    # UTF-8 без \uXXXX, как у orjson и row_to_json: байты ответа не зависят от кодировщика
+    return json.dumps(
+        data, cls=DjangoJSONEncoder, separators=(",", ":"), ensure_ascii=False
+    ).encode()
+
+
+def _sql_json_column(queryset: QuerySet, name: str, quote_name) -> str:
+    """Столбец d.name для row_to_json. Дробные числа PostgreSQL выводит без дробной
+    части (8 вместо 8.0), поэтому они переводятся в JSON так же, как в Python.
+    """
+    column = f"d.{quote_name(name)}"
+    annotation = queryset.query.annotation_select.get(name)
+    field = annotation.output_field if annotation else queryset.model._meta.get_field(name)
+    if not isinstance(field, FloatField):
+        return f"{column} AS {quote_name(name)}"
+
+    # до 1e15 PostgreSQL не переходит на экспоненту, а Python дописывает .0
+    return (
+        f"(CASE WHEN {column} = trunc({column}) AND abs({column}) < 1e15 "
+        f"THEN {column}::text || '.0' ELSE {column}::text END)::json AS {quote_name(name)}"
+    )
+
+
+def render_sql(queryset: QuerySet) -> Dict:
+    """Кодирует строки queryset.values(...) в JSON на стороне PostgreSQL (row_to_json)
+    и возвращает байты по id. Python не создаёт ни словарей, ни списков: на каждую
+    строку приходятся только id и готовая строка JSON.
+
+    Байты совпадают с dumps: компактный JSON, ключи в порядке полей values(),
+    даты в ISO 8601, id строками, дробные числа с дробной частью.
+    """
+    connection = connections[queryset.db]
+    query = queryset.query
+    names = [*query.extra_select, *query.values_select, *query.annotation_select]
+    columns = ", ".join(
+        _sql_json_column(queryset, name, connection.ops.quote_name) for name in names
+    )
+    sql, params = query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT d.id, row_to_json(r)::text FROM ({sql}) d, LATERAL (SELECT {columns}) r",
+            params,
+        )
+
+        return {pk: document.encode() for pk, document in cursor.fetchall()}
+
+
+@timed("serialize")
+def dumps_page(envelope: dict, results: Iterable[bytes], key: str = "results") -> bytes:
+    """JSON страницы: конверт с полями пагинации и уже закодированные документы.
+    Документы не декодируются и не кодируются повторно, поэтому подходят байты из кэша.
+    """
+    head = dumps(envelope)
+
+    # конверт — непустой объект: убираем закрывающую скобку и дописываем список
+    return head[:-1] + b',"' + key.encode() + b'":[' + b",".join(results) + b"]}"
+
+
+@timed("serialize")
+def dumps_mapping(envelope: dict, documents: Dict[str, bytes], key: str = "results") -> bytes:
+    """Как dumps_page, но закодированные документы складываются в объект по ключам."""
+    items = (dumps(name) + b":" + document for name, document in documents.items())
+    head = dumps(envelope)
+
+    return head[:-1] + b',"' + key.encode() + b'":{' + b",".join(items) + b"}}"
+
+
+class JsonBytesResponse(HttpResponse):
+    """Ответ с уже закодированным JSON."""
+
+    def __init__(self, content: bytes, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content, **kwargs)
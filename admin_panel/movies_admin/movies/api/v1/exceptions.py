@@ -0,0 +1,2 @@
+class InvalidParameter(ValueError):
+    """Некорректный параметр запроса к API. Обработчики возвращают на него ответ 400."""
@@ -0,0 +1,159 @@
+import uuid
+
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, Q, QuerySet
+
+from movies.documents import DOCUMENT_FIELDS
+from movies.models import FilmWork, FilmWorkType, GenreFilmWork, PersonFilmWork, RoleType
+from .exceptions import InvalidParameter
+
+# поля, по которым можно сортировать список фильмов через ?sort=
+SORT_FIELDS = ("title", "rating", "creation_date", "modified")
+# длина поискового запроса и текстовых фильтров
+MAX_TEXT_LENGTH = 200
+
+
+def _uuid_or_none(value: str):
+    try:
+        return uuid.UUID(value)
+    except ValueError:
+        return None
+
+
+def get_text(params, name: str) -> str:
+    """Текстовый параметр без пробелов по краям. PostgreSQL не принимает в строках
+    символ NUL, а слишком длинный поисковый запрос дорого разбирать, поэтому такие
+    значения отклоняются до запроса к БД."""
+    value = params.get(name, "").strip()
+    if "\x00" in value:
+        raise InvalidParameter(f"{name} не должен содержать символ NUL")
+    if len(value) > MAX_TEXT_LENGTH:
+        raise InvalidParameter(f"{name} должен быть не длиннее {MAX_TEXT_LENGTH} символов")
+
+    return value
+
+
+def _rating(params, name: str):
+    try:
+        return float(params[name])
+    except ValueError:
+        raise InvalidParameter(f"{name} должен быть числом")
+
+
+def filter_films(queryset: QuerySet, params) -> QuerySet:
+    """Применяет к queryset фильмов (или документов фильмов) фильтры из параметров запроса.
+
+    Фильтры по жанру и человеку выполняются как полусоединения (EXISTS) с таблицами связей,
+    поэтому отбираются только id фильмов и агрегация потом идёт по уже отфильтрованным
+    фильмам. Жанр и человека можно указать по id или по точному названию/имени.
+    """
+    if "type" in params:
+        if params["type"] not in FilmWorkType.values:
+            raise InvalidParameter(f"type должен быть одним из: {', '.join(FilmWorkType.values)}")
+        queryset = queryset.filter(type=params["type"])
+
+    if "rating_gte" in params:
+        queryset = queryset.filter(rating__gte=_rating(params, "rating_gte"))
+    if "rating_lte" in params:
+        queryset = queryset.filter(rating__lte=_rating(params, "rating_lte"))
+
+    if "genre" in params:
+        name = get_text(params, "genre")
+        genre_id = _uuid_or_none(name)
+        genre = Q(genre_id=genre_id) if genre_id else Q(genre__name=name)
+        queryset = queryset.filter(
+            Exists(GenreFilmWork.objects.filter(genre, film_work_id=OuterRef("id")))
+        )
+
+    if "role" in params and params["role"] not in RoleType.values:
+        raise InvalidParameter(f"role должен быть одним из: {', '.join(RoleType.values)}")
+    if "person" in params:
+        name = get_text(params, "person")
+        person_id = _uuid_or_none(name)
+        person = Q(person_id=person_id) if person_id else Q(person__full_name=name)
+        if "role" in params:
+            person &= Q(role=params["role"])
+        queryset = queryset.filter(
+            Exists(PersonFilmWork.objects.filter(person, film_work_id=OuterRef("id")))
+        )
+    elif "role" in params:
+        raise InvalidParameter("role используется только вместе с person")
+
+    return queryset
+
+
+def get_sort(params, default):
+    """Сортировка из ?sort=: поле из SORT_FIELDS, "-" в начале — по убыванию.
+    Фильмы без значения поля всегда идут в конце, id делает порядок однозначным.
+
+    Для полей NOT NULL порядок задаётся без NULLS LAST и id идёт в ту же сторону,
+    что и поле: тогда по убыванию PostgreSQL просто читает индекс (field, id) с конца.
+    """
+    if "sort" not in params:
+        return default
+
+    sort = params["sort"]
+    field = sort.lstrip("-")
+    if field not in SORT_FIELDS:
+        raise InvalidParameter(f"sort должен быть одним из: {', '.join(SORT_FIELDS)}")
+
+    if not FilmWork._meta.get_field(field).null:
+        return (sort, "-id") if sort.startswith("-") else (sort, "id")
+    if sort.startswith("-"):
+        return F(field).desc(nulls_last=True), "id"
+
+    return F(field).asc(nulls_last=True), "id"
+
+
+def _field_list(params, name: str):
+    fields = [field.strip() for field in params[name].split(",") if field.strip()]
+    unknown = [field for field in fields if field not in DOCUMENT_FIELDS]
+    if unknown:
+        raise InvalidParameter(
+            f"{name}: неизвестные поля {', '.join(unknown)}, "
+            f"доступны: {', '.join(DOCUMENT_FIELDS)}"
+        )
+
+    return fields
+
+
+def get_fields(params) -> tuple:
+    """Поля документа из ?fields= (только перечисленные) или ?exclude= (все, кроме
+    перечисленных). id нужен для сборки страниц, поэтому отдаётся всегда.
+    Порядок полей всегда как в DOCUMENT_FIELDS.
+    """
+    if "fields" in params and "exclude" in params:
+        raise InvalidParameter("fields и exclude нельзя указывать вместе")
+
+    if "fields" in params:
+        selected = set(_field_list(params, "fields")) | {"id"}
+    elif "exclude" in params:
+        excluded = set(_field_list(params, "exclude")) - {"id"}
+        selected = set(DOCUMENT_FIELDS) - excluded
+    else:
+        return DOCUMENT_FIELDS
+
+    return tuple(field for field in DOCUMENT_FIELDS if field in selected)
+
+
+def parse_ids(values) -> list:
+    """id фильмов для пакетного запроса: без повторов, в исходном порядке,
+    не больше MOVIES_API_BATCH_MAX_IDS."""
+    ids = []
+    for value in values:
+        if not isinstance(value, str):
+            raise InvalidParameter("ids должен содержать строки")
+        if not value.strip():
+            continue
+        pk = _uuid_or_none(value.strip())
+        if pk is None:
+            raise InvalidParameter(f"некорректный id: {value}")
+        ids.append(pk)
+
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise InvalidParameter("ids обязателен")
+    if len(ids) > settings.MOVIES_API_BATCH_MAX_IDS:
+        raise InvalidParameter(f"можно запросить не больше {settings.MOVIES_API_BATCH_MAX_IDS} id")
+
+    return ids
@@ -0,0 +1,132 @@
+import base64
+import binascii
+import json
+from typing import List, Optional, Tuple
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+
+from .exceptions import InvalidParameter
+
+
+def encode_cursor(payload: dict) -> str:
+    """Упаковывает позицию в непрозрачную для клиента строку."""
+    # str, а не DjangoJSONEncoder: он обрезает микросекунды у datetime,
+    # из-за чего ключ перестаёт быть точным
+    data = json.dumps(payload, default=str, separators=(",", ":")).encode()
+
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Распаковывает строку, полученную из encode_cursor."""
+    padding = "=" * (-len(cursor) % 4)
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidParameter("некорректный cursor")
+
+    if not isinstance(payload, dict):
+        raise InvalidParameter("некорректный cursor")
+
+    return payload
+
+
+class KeysetPage:
+    def __init__(self, ids: List, next_cursor: Optional[str], prev_cursor: Optional[str]):
+        self.ids = ids
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+
+class KeysetPaginator:
+    """Пагинация по ключу (field, id) без OFFSET и без COUNT(*).
+
+    Каждая страница выбирается условием вида (field, id) > (value, last_id)
+    и LIMIT, поэтому стоимость запроса не зависит от номера страницы.
+
+    Parameters
+    ----------
+    queryset : QuerySet
+        Queryset фильмов без агрегации
+    sort : str
+        Поле сортировки, "-" в начале означает обратный порядок.
+        Поле не должно принимать значение NULL
+    per_page : int
+        Размер страницы
+    """
+
+    def __init__(self, queryset: QuerySet, sort: str, per_page: int):
+        self.queryset = queryset
+        self.sort = sort
+        self.field = sort.lstrip("-")
+        self.descending = sort.startswith("-")
+        self.per_page = per_page
+
+    def _reversed(self, forward: bool) -> bool:
+        """Идёт ли обход в порядке убывания ключа."""
+        return self.descending == forward
+
+    def _after(self, key: Tuple, forward: bool) -> Q:
+        """Условие "строго после key" в направлении обхода."""
+        value, id_ = key
+        op = "lt" if self._reversed(forward) else "gt"
+
+        return Q(**{f"{self.field}__{op}": value}) | Q(**{self.field: value, f"id__{op}": id_})
+
+    def _ordering(self, forward: bool) -> Tuple[str, str]:
+        prefix = "-" if self._reversed(forward) else ""
+
+        return f"{prefix}{self.field}", f"{prefix}id"
+
+    def _parse_key(self, key) -> Tuple:
+        """Значения ключа из cursor в типах полей: cursor приходит от клиента, и без
+        проверки его значения попали бы в запрос как есть."""
+        if not isinstance(key, list) or len(key) != 2:
+            raise InvalidParameter("некорректный cursor")
+
+        parsed = []
+        for name, value in zip((self.field, "id"), key):
+            if not isinstance(value, str) or "\x00" in value:
+                raise InvalidParameter("некорректный cursor")
+            try:
+                parsed.append(self.queryset.model._meta.get_field(name).to_python(value))
+            except ValidationError:
+                raise InvalidParameter("некорректный cursor")
+
+        return tuple(parsed)
+
+    def _cursor(self, row: Tuple, direction: str) -> str:
+        return encode_cursor({"s": self.sort, "d": direction, "k": list(row)})
+
+    def page(self, cursor: Optional[str]) -> KeysetPage:
+        forward = True
+        queryset = self.queryset
+        if cursor:
+            payload = decode_cursor(cursor)
+            if payload.get("s") != self.sort or payload.get("d") not in ("n", "p"):
+                raise InvalidParameter("cursor не соответствует параметрам запроса")
+            key = self._parse_key(payload.get("k"))
+
+            forward = payload["d"] == "n"
+            queryset = queryset.filter(self._after(key, forward))
+
+        # берём на одну строку больше, чтобы узнать, есть ли следующая страница
+        rows = list(
+            queryset.order_by(*self._ordering(forward)).values_list(self.field, "id")[
+                : self.per_page + 1
+            ]
+        )
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if not forward:
+            rows.reverse()
+
+        next_cursor = prev_cursor = None
+        if rows:
+            if has_more or not forward:
+                next_cursor = self._cursor(rows[-1], "n")
+            if cursor and (has_more or forward):
+                prev_cursor = self._cursor(rows[0], "p")
+
+        return KeysetPage([id_ for _, id_ in rows], next_cursor, prev_cursor)
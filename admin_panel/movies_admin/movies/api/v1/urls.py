@@ -3,5 +3,9 @@ from . import views
 
 urlpatterns = [
     path("movies/", views.MoviesApi.as_view()),
+    path("movies/search/", views.MoviesSearchApi.as_view()),
+    path("movies/batch/", views.MoviesBatchApi.as_view()),
+    path("movies/changes/", views.MoviesChangesApi.as_view()),
+    path("movies/export/", views.MoviesExportApi.as_view()),
     path("movies/<uuid:pk>/", views.MoviesDetailApi.as_view())
 ]
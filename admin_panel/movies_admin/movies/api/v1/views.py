@@ -1,73 +1,389 @@
-from django.contrib.postgres.aggregates import ArrayAgg
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
 from django.db.models import Q
-from django.http import JsonResponse
+from django.db.models.expressions import RawSQL
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from django.views.generic.list import BaseListView
 from django.views.generic.detail import BaseDetailView
 
-from movies.models import FilmWork
+from movies.api import conditional
+from movies.api.cache import response_cache
+from movies.api.serializers import JsonBytesResponse, dumps, dumps_mapping, dumps_page, render_sql
+from movies.documents import document_values, search_documents
+from movies.export import gzip_stream, iter_ndjson
+from movies.models import FilmWork, FilmWorkChange, FilmWorkDocument
+from .exceptions import InvalidParameter
+from .filters import filter_films, get_fields, get_sort, get_text, parse_ids
+from .pagination import KeysetPaginator, decode_cursor, encode_cursor
 
 
 class MoviesApiMixin:
     model = FilmWork
     http_method_names = ["get"]  # Список методов, которые реализует обработчик
 
+    def get_cache_key(self) -> str:
+        """Ключ готового ответа в кэше, по умолчанию — по пути и параметрам запроса."""
+        return response_cache.list_key(self.request.path, self.request.GET)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            return self.get_response(request, *args, **kwargs)
+        except InvalidParameter as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+    def get_response(self, request, *args, **kwargs):
+        # готовый ответ отдаётся из кэша без обращения к БД
+        if not response_cache.enabled:
+            return super().get(request, *args, **kwargs)
+
+        key = self.get_cache_key()
+        content = response_cache.get(key)
+        if content is not None:
+            response = JsonBytesResponse(content)
+            response["X-Cache"] = "HIT"
+            return response
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            response_cache.set(key, response.content)
+        response["X-Cache"] = "MISS"
+
+        return response
+
+    def get_fields(self) -> tuple:
+        """Поля документа, запрошенные через ?fields= или ?exclude=."""
+        if not hasattr(self, "_fields"):
+            self._fields = get_fields(self.request.GET)
+
+        return self._fields
+
+    def get_source_queryset(self):
+        """Возвращает queryset, из которого берутся фильмы: таблицу фильмов
+        или таблицу документов фильмов."""
+        if settings.MOVIES_API_USE_DOCUMENTS:
+            return FilmWorkDocument.objects.all()
+
+        return FilmWork.objects.all()
+
+    def get_film_queryset(self):
+        """Возвращает queryset фильмов без агрегации по связанным таблицам."""
+        return self.get_source_queryset()
+
+    def aggregate(self, queryset):
+        """Добавляет к queryset фильмов списки актёров, режиссёров, сценаристов и жанров.
+        Незапрошенные поля не выбираются, а для незапрошенных списков не делаются
+        соединения со связанными таблицами.
+        """
+        return document_values(queryset, self.get_fields())
+
     def get_queryset(self):
-        values = ("id", "title", "description", "creation_date", "rating", "type")
-        query = FilmWork.objects.values(*values).annotate(
-            actors=ArrayAgg(
-                "personfilmwork__person__full_name",
-                filter=Q(personfilmwork__role="actor"),
-                distinct=True,
-            ),
-            directors=ArrayAgg(
-                "personfilmwork__person__full_name",
-                filter=Q(personfilmwork__role="director"),
-                distinct=True,
-            ),
-            writers=ArrayAgg(
-                "personfilmwork__person__full_name",
-                filter=Q(personfilmwork__role="writer"),
-                distinct=True,
-            ),
-            genres=ArrayAgg("genres__name", distinct=True),
-        )
+        return self.aggregate(self.get_film_queryset())
+
+    def encode_documents(self, ids) -> dict:
+        """Агрегирует только фильмы с указанными id и кодирует их документы в JSON.
+        При MOVIES_API_RENDERING = "sql" документы кодирует PostgreSQL."""
+        queryset = self.aggregate(self.get_source_queryset().filter(id__in=ids))
+        if settings.MOVIES_API_RENDERING == "sql":
+            return render_sql(queryset)
+
+        return {row["id"]: dumps(row) for row in queryset}
 
-        return query
+    def get_encoded_documents(self, ids) -> dict:
+        """Закодированные в JSON документы найденных фильмов по id. Документы, которые уже
+        есть в кэше, не агрегируются и не кодируются заново."""
+        if not response_cache.enabled:
+            return self.encode_documents(ids) if ids else {}
+
+        # ключи с версиями фильмов берутся до чтения из БД, см. document_keys
+        keys = response_cache.document_keys(ids, self.get_fields())
+        cached = response_cache.get_documents(keys)
+        missing = [id_ for id_ in ids if id_ not in cached]
+        encoded = {}
+        if missing:
+            encoded = self.encode_documents(missing)
+            response_cache.set_documents(encoded, keys)
+
+        return {**cached, **encoded}
 
     def render_to_response(self, context, **response_kwargs):
-        return JsonResponse(context)
+        return JsonBytesResponse(dumps(context))
 
 
+@method_decorator(
+    condition(etag_func=conditional.list_etag, last_modified_func=conditional.list_last_modified),
+    name="dispatch",
+)
 class MoviesApi(MoviesApiMixin, BaseListView):
     model = FilmWork
     http_method_names = ["get"]
 
     paginate_by = 50
+    # сортировка должна быть однозначной, иначе страницы будут пересекаться
+    ordering = ("title", "id")
+
+    # поля, по которым возможна пагинация по ключу в режиме ?cursor=,
+    # все они NOT NULL, к каждому добавляется id
+    cursor_sorts = ("title", "-title", "modified", "-modified")
+    count_modes = ("none", "exact", "cached")
+
+    def get_film_queryset(self):
+        # фильтры применяются до агрегации, к одним только id фильмов
+        return filter_films(super().get_film_queryset(), self.request.GET)
+
+    def get_ordering(self):
+        return get_sort(self.request.GET, self.ordering)
+
+    def get_encoded_results(self, ids):
+        """Закодированные документы фильмов страницы в порядке ids."""
+        documents = self.get_encoded_documents(ids)
+
+        return [documents[id_] for id_ in ids if id_ in documents]
+
+    def render_to_response(self, context, **response_kwargs):
+        envelope = {key: value for key, value in context.items() if key != "results"}
+
+        return JsonBytesResponse(dumps_page(envelope, context["results"]))
+
+    def get_count(self, queryset, mode: str):
+        """Считает количество фильмов. В режиме cached результат хранится в кэше,
+        чтобы обход всего каталога не запускал COUNT(*) на каждой странице.
+        """
+        if mode == "none":
+            return None
+        if mode == "exact":
+            return queryset.count()
+
+        key = "movies:count:" + hashlib.md5(str(queryset.query).encode()).hexdigest()
+
+        return cache.get_or_set(key, queryset.count, settings.MOVIES_API_COUNT_CACHE_TIMEOUT)
+
+    def get_cursor_context_data(self):
+        """Пагинация по ключу для режима ?cursor=: без OFFSET и по умолчанию без COUNT(*)."""
+        sort = self.request.GET.get("sort", "title")
+        if sort not in self.cursor_sorts:
+            raise InvalidParameter(f"sort должен быть одним из: {', '.join(self.cursor_sorts)}")
+        count_mode = self.request.GET.get("count", "none")
+        if count_mode not in self.count_modes:
+            raise InvalidParameter(f"count должен быть одним из: {', '.join(self.count_modes)}")
+
+        queryset = self.get_film_queryset()
+        paginator = KeysetPaginator(queryset, sort, self.paginate_by)
+        page = paginator.page(self.request.GET["cursor"])
+
+        context = {
+            "count": self.get_count(queryset, count_mode),
+            "prev": page.prev_cursor,
+            "next": page.next_cursor,
+            "results": self.get_encoded_results(page.ids),
+        }
+
+        return context
 
     def get_context_data(self, *, object_list=None, **kwargs):
-        queryset = self.get_queryset()
+        if "cursor" in self.request.GET:
+            return self.get_cursor_context_data()
+
+        # сначала выбираем только id фильмов страницы, а тяжёлую агрегацию
+        # по персонам и жанрам запускаем уже для них
+        ids = self.get_film_queryset().order_by(*self.get_ordering()).values_list("id", flat=True)
         page_size = self.paginate_by
 
-        paginator, page, object_list, _ = self.paginate_queryset(queryset, page_size)
+        paginator, page, page_ids, _ = self.paginate_queryset(ids, page_size)
 
         context = {
             "count": paginator.count,
             "total_pages": paginator.num_pages,
             "prev": page.previous_page_number() if page.has_previous() else None,
             "next": page.next_page_number() if page.has_next() else None,
-            "results": list(queryset),
+            "results": self.get_encoded_results(list(page_ids)),
         }
 
         return context
 
 
+class MoviesSearchApi(MoviesApi):
+    """Полнотекстовый поиск по фильмам (?q=), результаты отсортированы по релевантности.
+    Ищет по документам фильмов, поэтому работает независимо от MOVIES_API_USE_DOCUMENTS.
+    """
+
+    ordering = ("-rank", "id")
+
+    def get_source_queryset(self):
+        text = get_text(self.request.GET, "q")
+        if not text:
+            raise InvalidParameter("параметр q обязателен")
+
+        return search_documents(text)
+
+    def get_cursor_context_data(self):
+        # курсор строится по полю таблицы, а релевантность вычисляется в самом запросе,
+        # поэтому результаты поиска листаются только по номеру страницы
+        raise InvalidParameter("cursor не поддерживается в поиске, используйте page")
+
+
+@method_decorator(
+    condition(
+        etag_func=conditional.detail_etag, last_modified_func=conditional.detail_last_modified
+    ),
+    name="dispatch",
+)
 class MoviesDetailApi(MoviesApiMixin, BaseDetailView):
     model = FilmWork
     http_method_names = ["get"]
 
-    def get_context_data(self, *, object_list=None, **kwargs):
-        pk = self.get_object()["id"]
-        context = super().get_context_data(kwargs={"pk": pk})
-        context = context["object"]
+    def get_cache_key(self) -> str:
+        return response_cache.detail_key(self.kwargs["pk"], self.request.GET)
 
-        return context
+    def get_object(self, queryset=None):
+        # документ фильма собирается так же, как для списка, и берётся из того же кэша
+        pk = self.kwargs["pk"]
+        document = self.get_encoded_documents([pk]).get(pk)
+        if document is None:
+            raise Http404("фильм не найден")
+
+        return document
+
+    def get_context_data(self, **kwargs):
+        # фильм уже выбран и закодирован в get(), повторный запрос не нужен
+        return self.object
+
+    def render_to_response(self, context, **response_kwargs):
+        return JsonBytesResponse(context)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class MoviesBatchApi(MoviesApiMixin, View):
+    """Несколько фильмов по id за один запрос: GET ?ids=<id>,<id> или POST с телом
+    {"ids": [...]}. Найденные фильмы возвращаются по id, ненайденные — в списке missing.
+    """
+
+    http_method_names = ["get", "post"]
+
+    def get_ids(self) -> list:
+        if self.request.method == "GET":
+            return parse_ids(self.request.GET.get("ids", "").split(","))
+
+        try:
+            body = json.loads(self.request.body)
+        except ValueError:
+            raise InvalidParameter("тело запроса должно быть JSON")
+        if not isinstance(body, dict) or not isinstance(body.get("ids"), list):
+            raise InvalidParameter('тело запроса должно быть вида {"ids": [...]}')
+
+        return parse_ids(body["ids"])
+
+    def get_response(self, request, *args, **kwargs):
+        # ответ целиком не кэшируется: наборы id почти не повторяются,
+        # а документы отдельных фильмов берутся из кэша
+        ids = self.get_ids()
+        documents = self.get_encoded_documents(ids)
+        missing = [str(id_) for id_ in ids if id_ not in documents]
+        results = {str(id_): documents[id_] for id_ in ids if id_ in documents}
+
+        return JsonBytesResponse(dumps_mapping({"missing": missing}, results))
+
+    def post(self, request, *args, **kwargs):
+        return self.get(request, *args, **kwargs)
+
+
+class MoviesChangesApi(View):
+    """Лента изменений фильмов для инкрементальной синхронизации: GET ?since=<cursor>.
+
+    Возвращает id изменённых и удалённых фильмов из журнала film_work_change в порядке
+    транзакций и курсор next, с которого нужно продолжить. Отдаются только записи
+    транзакций старше txid_snapshot_xmin: все они уже завершены, а записи ещё
+    не зафиксированных транзакций получат бОльший номер, поэтому курсор их не пропустит.
+    Начальное состояние нужно получить полной выгрузкой каталога.
+    """
+
+    http_method_names = ["get"]
+    page_size = 500
+
+    def get(self, request, *args, **kwargs):
+        try:
+            context = self.get_context_data()
+        except InvalidParameter as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        return JsonBytesResponse(dumps(context))
+
+    def get_position(self):
+        if not self.request.GET.get("since"):
+            return None
+
+        key = decode_cursor(self.request.GET["since"]).get("k")
+        if not (isinstance(key, list) and len(key) == 2 and all(isinstance(v, int) for v in key)):
+            raise InvalidParameter("некорректный since")
+
+        return key
+
+    def get_context_data(self):
+        queryset = FilmWorkChange.objects.filter(
+            transaction_id__lt=RawSQL("txid_snapshot_xmin(txid_current_snapshot())", [])
+        )
+        position = self.get_position()
+        if position is not None:
+            transaction_id, id_ = position
+            queryset = queryset.filter(
+                Q(transaction_id__gt=transaction_id) | Q(transaction_id=transaction_id, id__gt=id_)
+            )
+        rows = list(
+            queryset.order_by("transaction_id", "id")
+            .values("id", "transaction_id", "film_work_id", "deleted", "created")[:self.page_size]
+        )
+
+        # фильм мог меняться несколько раз подряд: оставляем последнее изменение
+        changes = {}
+        for row in rows:
+            changes.pop(row["film_work_id"], None)
+            changes[row["film_work_id"]] = {
+                "id": row["film_work_id"],
+                "deleted": row["deleted"],
+                "changed": row["created"],
+            }
+
+        if rows:
+            next_cursor = encode_cursor({"k": [rows[-1]["transaction_id"], rows[-1]["id"]]})
+        else:
+            next_cursor = self.request.GET.get("since") or None
+
+        return {
+            "changes": list(changes.values()),
+            "next": next_cursor,
+            "has_more": len(rows) == self.page_size,
+        }
+
+
+class MoviesExportApi(MoviesApiMixin, View):
+    """Выгрузка всех фильмов (с фильтрами и ?fields= как у списка) потоком NDJSON.
+    Если клиент принимает gzip, поток сжимается.
+    """
+
+    http_method_names = ["get"]
+    chunk_size = 2000
+
+    def get_response(self, request, *args, **kwargs):
+        # поток не кэшируется: ответ целиком никогда не собирается в памяти
+        queryset = self.get_queryset().order_by("id")
+        chunks = iter_ndjson(queryset, chunk_size=self.chunk_size)
+        response = StreamingHttpResponse(content_type="application/x-ndjson")
+        if "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", ""):
+            chunks = gzip_stream(chunks)
+            response["Content-Encoding"] = "gzip"
+        response["Vary"] = "Accept-Encoding"
+        # прокси не должны буферизовать и кэшировать поток
+        response["X-Accel-Buffering"] = "no"
+        response["Cache-Control"] = "no-store"
+        response.streaming_content = chunks
+
+        return response
+
+    def get_film_queryset(self):
+        return filter_films(super().get_film_queryset(), self.request.GET)
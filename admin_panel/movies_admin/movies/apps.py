@@ -1,11 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import pre_migrate
 
 
 class MoviesConfig(AppConfig):
     name = 'movies'
 
-
-class AppsConfig():
-
     def ready(self):
         from . import signals
+
+        pre_migrate.connect(signals.create_content_schema, sender=self)
@@ -0,0 +1,191 @@
+import bisect
+import io
+import itertools
+import random
+import uuid
+from datetime import date, timedelta
+from typing import Iterable, Iterator, List
+
+from django.db import connection
+from django.utils import timezone
+
+from movies.models import FilmWork, Genre, GenreFilmWork, Person, PersonFilmWork
+
+WORDS = (
+    "Star", "Night", "Road", "River", "Crescent", "Shadow", "Winter", "Last", "Silent",
+    "Golden", "City", "Storm", "Secret", "Broken", "Dream", "Island", "Fire", "Ghost",
+    "Heart", "Empire", "Return", "Journey", "Stranger", "Garden", "Mirror", "Ocean",
+)
+FIRST_NAMES = (
+    "Mark", "Anna", "Darrell", "Maria", "Turgut", "Elena", "John", "Olga", "Michael",
+    "Sofia", "Ivan", "Emma", "Pavel", "Laura", "Omar", "Yuki", "Carlos", "Ingrid",
+)
+LAST_NAMES = (
+    "Hamill", "Geer", "Adiguzel", "Bond", "Ivanova", "Smith", "Petrov", "Garcia",
+    "Tanaka", "Larsen", "Novak", "Rossi", "Kowalski", "Okafor", "Dubois", "Silva",
+)
+# сколько строк отправлять в одной команде COPY
+COPY_BATCH_SIZE = 100000
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+
+    return str(value).translate(COPY_ESCAPES)
+
+
+def _table(model) -> str:
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def copy_rows(model, columns: List[str], rows: Iterable[tuple], batch_size=COPY_BATCH_SIZE):
+    """Загружает строки в таблицу модели командой COPY, пачками по batch_size строк,
+    чтобы не держать всю таблицу в памяти."""
+    sql = f"COPY {_table(model)} ({', '.join(columns)}) FROM STDIN"
+    rows = iter(rows)
+    with connection.cursor() as cursor:
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                return
+            buffer = io.StringIO(
+                "".join("\t".join(_copy_value(value) for value in row) + "\n" for row in batch)
+            )
+            cursor.copy_expert(sql, buffer)
+
+
+class Zipf:
+    """Выбор из n элементов с вероятностью, обратной rank ** exponent: несколько
+    элементов встречаются очень часто, остальные образуют длинный хвост."""
+
+    def __init__(self, n: int, exponent: float, rnd: random.Random):
+        self.rnd = rnd
+        weights = (1 / rank ** exponent for rank in range(1, n + 1))
+        self.cum_weights = list(itertools.accumulate(weights))
+        self.total = self.cum_weights[-1]
+
+    def __call__(self) -> int:
+        return bisect.bisect_left(self.cum_weights, self.rnd.random() * self.total)
+
+
+def _uuid(rnd: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rnd.getrandbits(128), version=4)
+
+
+def _random_date(rnd: random.Random, start: date, days: int) -> date:
+    return start + timedelta(days=rnd.randrange(days))
+
+
+def generate_catalogue(
+    films: int,
+    persons: int,
+    genres: int = 50,
+    credits: int = 8,
+    seed: int = 0,
+    batch_size: int = COPY_BATCH_SIZE,
+) -> dict:
+    """Генерирует каталог и загружает его командой COPY в текущей транзакции.
+
+    Распределения неравномерные, как в настоящем каталоге: популярность людей и жанров
+    подчиняется закону Ципфа (несколько очень занятых актёров и длинный хвост жанров),
+    число участников фильма — экспоненциальное со средним credits, рейтинги смещены
+    к высоким. При одинаковом seed данные, включая id, получаются одинаковыми.
+
+    Сигналы не вызываются: документы фильмов нужно собрать командой refresh_documents.
+    Возвращает количество строк по таблицам.
+    """
+    rnd = random.Random(seed)
+    now = timezone.now()
+    counts = {}
+
+    genre_ids = [_uuid(rnd) for _ in range(genres)]
+    copy_rows(
+        Genre, ["id", "name", "description", "created", "modified"],
+        ((pk, f"Genre {i} {rnd.choice(WORDS)}", "", now, now) for i, pk in enumerate(genre_ids)),
+        batch_size,
+    )
+    counts["genre"] = genres
+
+    person_ids = [_uuid(rnd) for _ in range(persons)]
+    copy_rows(
+        Person, ["id", "full_name", "birth_date", "created", "modified"],
+        (
+            (
+                pk,
+                f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)} {i}",
+                _random_date(rnd, date(1930, 1, 1), 30000) if rnd.random() < 0.7 else None,
+                now,
+                now,
+            )
+            for i, pk in enumerate(person_ids)
+        ),
+        batch_size,
+    )
+    counts["person"] = persons
+
+    film_ids = [_uuid(rnd) for _ in range(films)]
+    copy_rows(
+        FilmWork,
+        ["id", "title", "description", "creation_date", "certificate", "rating", "type",
+         "created", "modified"],
+        (
+            (
+                pk,
+                f"{rnd.choice(WORDS)} {rnd.choice(WORDS)} (Film {i})",
+                " ".join(rnd.choices(WORDS, k=rnd.randrange(5, 40))),
+                _random_date(rnd, date(1920, 1, 1), 37000),
+                "",
+                round(rnd.betavariate(5, 2) * 10, 1) if rnd.random() < 0.9 else None,
+                "film" if rnd.random() < 0.8 else "series",
+                now,
+                now,
+            )
+            for i, pk in enumerate(film_ids)
+        ),
+        batch_size,
+    )
+    counts["film_work"] = films
+
+    pick_person = Zipf(persons, 1.1, rnd)
+    pick_genre = Zipf(genres, 1.5, rnd)
+
+    counts["person_film_work"] = counts["genre_film_work"] = 0
+
+    def person_links() -> Iterator[tuple]:
+        for film_id in film_ids:
+            # у каждого фильма есть хотя бы режиссёр и сценарист, остальные — актёры
+            size = 2 + int(rnd.expovariate(1 / max(credits - 2, 1)))
+            seen = set()
+            for i in range(min(size, persons)):
+                role = "director" if i == 0 else "writer" if i == 1 else "actor"
+                person_id = person_ids[pick_person()]
+                if (person_id, role) in seen:
+                    continue
+                seen.add((person_id, role))
+                counts["person_film_work"] += 1
+                yield _uuid(rnd), film_id, person_id, role, now
+
+    def genre_links() -> Iterator[tuple]:
+        for film_id in film_ids:
+            size = 1 + int(rnd.expovariate(1 / 1.5))
+            chosen = {genre_ids[pick_genre()] for _ in range(size)}
+            for genre_id in chosen:
+                counts["genre_film_work"] += 1
+                yield _uuid(rnd), film_id, genre_id, now
+
+    copy_rows(
+        PersonFilmWork, ["id", "film_work_id", "person_id", "role", "created"],
+        person_links(), batch_size,
+    )
+    copy_rows(
+        GenreFilmWork, ["id", "film_work_id", "genre_id", "created"],
+        genre_links(), batch_size,
+    )
+
+    with connection.cursor() as cursor:
+        for model in (FilmWork, Person, Genre, PersonFilmWork, GenreFilmWork):
+            cursor.execute(f"ANALYZE {_table(model)}")
+
+    return counts
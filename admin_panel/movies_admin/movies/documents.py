@@ -0,0 +1,243 @@
+import logging
+import threading
+from itertools import islice
+from typing import Callable, Iterable, Optional, Sequence
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, transaction
+from django.db.models import F, Func, OuterRef, Q, QuerySet, Subquery, TextField, Value
+
+from movies.models import FilmWork, FilmWorkDocument, GenreFilmWork, PersonFilmWork
+
+logger = logging.getLogger(__name__)
+
+# поля фильма, которые отдаёт API
+FILM_FIELDS = ("id", "title", "description", "creation_date", "rating", "type")
+# списки, которые собираются из связанных таблиц
+ARRAY_FIELDS = ("actors", "directors", "writers", "genres")
+# поля документа фильма в API
+DOCUMENT_FIELDS = FILM_FIELDS + ARRAY_FIELDS
+
+
+# способы собрать списки людей и жанров, см. aggregate_films
+AGGREGATIONS = ("join", "subquery")
+
+
+class ArraySubquery(Subquery):
+    """ARRAY(SELECT ...): коррелированный подзапрос, значения которого собираются в массив.
+    В Django 3.1 такого выражения ещё нет.
+    """
+
+    template = "ARRAY(%(subquery)s)"
+
+    def __init__(self, queryset, **extra):
+        super().__init__(queryset, output_field=ArrayField(TextField()), **extra)
+
+
+def _person_names(role: str) -> ArrayAgg:
+    return ArrayAgg(
+        "personfilmwork__person__full_name",
+        filter=Q(personfilmwork__role=role),
+        distinct=True,
+    )
+
+
+def _person_names_subquery(role: str) -> ArraySubquery:
+    names = PersonFilmWork.objects.filter(film_work_id=OuterRef("id"), role=role)
+
+    return ArraySubquery(
+        names.order_by("person__full_name").values_list("person__full_name", flat=True).distinct()
+    )
+
+
+def _genre_names_subquery() -> ArraySubquery:
+    names = GenreFilmWork.objects.filter(film_work_id=OuterRef("id"))
+
+    return ArraySubquery(
+        names.order_by("genre__name").values_list("genre__name", flat=True).distinct()
+    )
+
+
+def aggregate_films(
+    queryset: QuerySet,
+    fields: Sequence[str] = FILM_FIELDS,
+    arrays: Sequence[str] = ARRAY_FIELDS,
+    aggregation: Optional[str] = None,
+) -> QuerySet:
+    """Добавляет к queryset фильмов списки актёров, режиссёров, сценаристов и жанров.
+    Соединения и группировка добавляются только для списков из arrays.
+
+    aggregation (по умолчанию MOVIES_API_AGGREGATION) задаёт способ:
+
+    - join — все связи соединяются в одном GROUP BY с ARRAY_AGG(DISTINCT ...).
+      Для каждого фильма PostgreSQL перебирает произведение людей на жанры:
+      40 участников и 5 жанров дают 200 строк ради 45 значений;
+    - subquery — каждый список считается отдельным подзапросом ARRAY(SELECT ...)
+      по своей таблице связей, без размножения строк и без группировки.
+    """
+    aggregation = aggregation or settings.MOVIES_API_AGGREGATION
+    if aggregation == "subquery":
+        aggregates = {
+            "actors": lambda: _person_names_subquery("actor"),
+            "directors": lambda: _person_names_subquery("director"),
+            "writers": lambda: _person_names_subquery("writer"),
+            "genres": _genre_names_subquery,
+        }
+    else:
+        aggregates = {
+            "actors": lambda: _person_names("actor"),
+            "directors": lambda: _person_names("director"),
+            "writers": lambda: _person_names("writer"),
+            "genres": lambda: ArrayAgg("genres__name", distinct=True),
+        }
+    query = queryset.values(*fields)
+    if arrays:
+        query = query.annotate(**{name: aggregates[name]() for name in arrays})
+
+    return query
+
+
+def document_values(queryset: QuerySet, fields: Sequence[str] = DOCUMENT_FIELDS) -> QuerySet:
+    """Документы фильмов в том виде, в котором их отдаёт API: словари с полями fields.
+    Для queryset по film_work_document списки уже посчитаны, для фильмов они агрегируются.
+    """
+    if queryset.model is FilmWorkDocument:
+        return queryset.values(*fields)
+
+    return aggregate_films(
+        queryset,
+        [field for field in fields if field in FILM_FIELDS],
+        [field for field in fields if field in ARRAY_FIELDS],
+    )
+
+
+def _joined(field: str) -> Func:
+    return Func(F(field), Value(" "), function="array_to_string", output_field=TextField())
+
+
+def search_vector() -> SearchVector:
+    """Поисковый вектор документа: название весит больше всего, затем жанры и люди,
+    затем описание.
+    """
+    config = settings.MOVIES_SEARCH_CONFIG
+
+    return (
+        SearchVector("title", weight="A", config=config)
+        + SearchVector(_joined("genres"), weight="B", config=config)
+        + SearchVector(
+            _joined("actors"), _joined("directors"), _joined("writers"),
+            weight="B", config=config,
+        )
+        + SearchVector("description", weight="C", config=config)
+    )
+
+
+def search_documents(text: str, queryset: Optional[QuerySet] = None) -> QuerySet:
+    """Документы, подходящие под поисковый запрос, с релевантностью в поле rank.
+    Запрос разбирается как в поисковиках: кавычки, OR и минус поддерживаются.
+    """
+    if queryset is None:
+        queryset = FilmWorkDocument.objects.all()
+    query = SearchQuery(text, config=settings.MOVIES_SEARCH_CONFIG, search_type="websearch")
+
+    return queryset.filter(search_vector=query).annotate(rank=SearchRank(F("search_vector"), query))
+
+
+def refresh_documents(ids: Optional[Iterable] = None, batch_size: int = 1000) -> int:
+    """Пересобирает документы фильмов с указанными id, а если id не заданы — все документы.
+    Документы удалённых фильмов удаляются. Возвращает количество записанных документов.
+    """
+    if ids is None:
+        with transaction.atomic():
+            FilmWorkDocument.objects.all().delete()
+            # документы собираются пачками, чтобы агрегация не шла по всей таблице сразу
+            film_ids = FilmWork.objects.values_list("id", flat=True).iterator(batch_size)
+            count = 0
+            while True:
+                batch = list(islice(film_ids, batch_size))
+                if not batch:
+                    return count
+                count += _write_documents(batch)
+
+    # каждая пачка в своей транзакции: правка популярного жанра затрагивает тысячи
+    # фильмов, и одна большая агрегация надолго заняла бы БД и блокировки
+    ids = iter(ids)
+    count = 0
+    while True:
+        batch = list(islice(ids, batch_size))
+        if not batch:
+            return count
+        with transaction.atomic():
+            FilmWorkDocument.objects.filter(id__in=batch).delete()
+            count += _write_documents(batch)
+
+
+def _write_documents(ids) -> int:
+    rows = aggregate_films(FilmWork.objects.filter(id__in=ids), FILM_FIELDS + ("modified",))
+    documents = FilmWorkDocument.objects.bulk_create(FilmWorkDocument(**row) for row in rows)
+    FilmWorkDocument.objects.filter(id__in=ids).update(search_vector=search_vector())
+
+    return len(documents)
+
+
+class DocumentRefresher:
+    """Пересобирает документы изменившихся фильмов в фоновом потоке, вне запроса,
+    который их изменил. Пока поток занят, id копятся и затем обрабатываются вместе,
+    пачками по batch_size. После каждой пачки вызывается on_refreshed(ids), например
+    чтобы сбросить кэш ответов: раньше этого делать нельзя, иначе в кэш попадут
+    старые документы под новой версией.
+
+    Необработанные id теряются при остановке процесса, их документы исправит
+    следующий запуск refresh_documents.
+    """
+
+    def __init__(self, on_refreshed: Callable[[list], None], batch_size: int = 1000):
+        self.on_refreshed = on_refreshed
+        self.batch_size = batch_size
+        self._pending = {}
+        self._busy = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def add(self, ids: Iterable):
+        with self._condition:
+            self._pending.update(dict.fromkeys(ids))
+            if self._thread is None or not self._thread.is_alive():
+                # поток запускается в процессе воркера при первом изменении
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def wait(self):
+        """Ждёт, пока все накопленные документы будут пересобраны."""
+        with self._condition:
+            self._condition.wait_for(lambda: not self._pending and not self._busy)
+
+    def _take(self) -> list:
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending)
+            ids = list(self._pending)
+            self._pending = {}
+            self._busy = True
+
+        return ids
+
+    def _run(self):
+        while True:
+            ids = self._take()
+            try:
+                for start in range(0, len(ids), self.batch_size):
+                    batch = ids[start:start + self.batch_size]
+                    refresh_documents(batch, self.batch_size)
+                    self.on_refreshed(batch)
+            except Exception:
+                logger.exception("не удалось пересобрать документы %d фильмов", len(ids))
+            finally:
+                # у потока своё соединение с БД, между пачками оно не держится открытым
+                connection.close()
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
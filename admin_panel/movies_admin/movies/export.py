@@ -0,0 +1,47 @@
+import zlib
+from typing import Iterable, Iterator
+
+from django.db import transaction
+from django.db.models import QuerySet
+
+from movies.api.serializers import dumps
+
+# примерный размер куска потока: строки документов склеиваются, чтобы не отдавать
+# клиенту и не сжимать каждую строку по отдельности
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+
+def iter_ndjson(queryset: QuerySet, chunk_size: int = 2000) -> Iterator[bytes]:
+    """Выгружает документы из queryset (см. movies.documents.document_values) в формате
+    NDJSON: по одному JSON-документу в строке.
+
+    Строки читаются через iterator(chunk_size), то есть серверным курсором, поэтому
+    память не зависит от размера каталога. Курсор открывается внутри транзакции:
+    без неё Django объявляет курсор WITH HOLD, что не работает через pgbouncer
+    в режиме transaction и заставляет PostgreSQL материализовать весь результат.
+    """
+    buffer = []
+    size = 0
+    with transaction.atomic():
+        for row in queryset.iterator(chunk_size=chunk_size):
+            line = dumps(row) + b"\n"
+            buffer.append(line)
+            size += len(line)
+            if size >= EXPORT_BUFFER_SIZE:
+                yield b"".join(buffer)
+                buffer = []
+                size = 0
+
+    if buffer:
+        yield b"".join(buffer)
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Сжимает поток в формат gzip по мере чтения."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+
+    yield compressor.flush()
@@ -0,0 +1,113 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from movies.documents import AGGREGATIONS, aggregate_films
+from movies.models import FilmWork, Genre, GenreFilmWork, Person, PersonFilmWork
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает способы сборки списков людей и жанров (MOVIES_API_AGGREGATION) на "
+        "фильмах с большим числом участников: сколько строк обрабатывает план и сколько "
+        "занимает запрос страницы. Данные генерируются во временной транзакции."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--films", type=int, default=1000,
+            help="сколько фильмов сгенерировать",
+        )
+        parser.add_argument(
+            "--credits", type=int, default=40,
+            help="сколько людей у каждого фильма",
+        )
+        parser.add_argument(
+            "--genres", type=int, default=5,
+            help="сколько жанров у каждого фильма",
+        )
+        parser.add_argument(
+            "--page-size", type=int, default=50,
+            help="сколько фильмов агрегировать за запрос, как на странице API",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20,
+            help="сколько раз выполнить запрос каждым способом",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="seed генератора данных",
+        )
+
+    def generate(self, options):
+        rnd = random.Random(options["seed"])
+        genres = Genre.objects.bulk_create(Genre(name=f"Genre {i}") for i in range(50))
+        persons = Person.objects.bulk_create(
+            (Person(full_name=f"Person {i}") for i in range(options["credits"] * 20)),
+            batch_size=5000,
+        )
+        films = FilmWork.objects.bulk_create(
+            (FilmWork(title=f"Film {i}", type="film") for i in range(options["films"])),
+            batch_size=5000,
+        )
+        roles = ("actor", "director", "writer")
+        PersonFilmWork.objects.bulk_create(
+            (
+                PersonFilmWork(film_work=film, person=person, role=roles[min(i % 10, 2)])
+                for film in films
+                for i, person in enumerate(rnd.sample(persons, options["credits"]))
+            ),
+            batch_size=5000,
+        )
+        GenreFilmWork.objects.bulk_create(
+            (
+                GenreFilmWork(film_work=film, genre=genre)
+                for film in films
+                for genre in rnd.sample(genres, options["genres"])
+            ),
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            for model in (FilmWork, Person, Genre, PersonFilmWork, GenreFilmWork):
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+
+        return [film.pk for film in films[:options["page_size"]]]
+
+    @staticmethod
+    def processed_rows(plan: dict) -> int:
+        """Сколько строк выдали все узлы плана с учётом повторных выполнений
+        (подзапросов и вложенных циклов)."""
+        rows = plan["Actual Rows"] * plan["Actual Loops"]
+
+        return rows + sum(Command.processed_rows(child) for child in plan.get("Plans", []))
+
+    def measure(self, ids, aggregation: str, repeat: int):
+        queryset = aggregate_films(FilmWork.objects.filter(id__in=ids), aggregation=aggregation)
+        plan = json.loads(queryset.explain(format="json", analyze=True))[0]["Plan"]
+
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        return self.processed_rows(plan), statistics.median(timings)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            ids = self.generate(options)
+            self.stdout.write(
+                f"фильмов на странице: {len(ids)}, людей у фильма: {options['credits']}, "
+                f"жанров у фильма: {options['genres']}"
+            )
+            for aggregation in AGGREGATIONS:
+                rows, median = self.measure(ids, aggregation, options["repeat"])
+                self.stdout.write(
+                    f"{aggregation:10} строк в плане: {rows:10}  медиана: {median:8.2f} мс"
+                )
+            # сгенерированные данные не должны остаться в базе
+            transaction.set_rollback(True)
@@ -0,0 +1,79 @@
+import json
+import timeit
+import uuid
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from movies.api import serializers
+from movies.api.serializers import dumps_page
+from movies.documents import DOCUMENT_FIELDS, aggregate_films
+from movies.models import FilmWork
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает скорость кодирования страницы API: JsonResponse (json + DjangoJSONEncoder), "
+        "orjson и сборку страницы из заранее закодированных документов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size", type=int, default=50,
+            help="сколько фильмов на странице",
+        )
+        parser.add_argument(
+            "--number", type=int, default=1000,
+            help="сколько раз кодировать страницу в каждом режиме",
+        )
+        parser.add_argument(
+            "--from-db", action="store_true",
+            help="взять фильмы из базы, а не сгенерировать",
+        )
+
+    def get_results(self, size: int, from_db: bool):
+        if from_db:
+            return list(aggregate_films(FilmWork.objects.order_by("title", "id")[:size]))
+
+        names = [f"Person {i}" for i in range(10)]
+        return [
+            {
+                "id": uuid.uuid4(),
+                "title": f"Film {i}",
+                "description": "Lorem ipsum dolor sit amet. " * 10,
+                "creation_date": date(2000, 1, 1),
+                "rating": 7.5,
+                "type": "film",
+                "actors": names,
+                "directors": names[:1],
+                "writers": names[:3],
+                "genres": ["Drama", "Comedy"],
+            }
+            for i in range(size)
+        ]
+
+    def handle(self, *args, **options):
+        results = self.get_results(options["size"], options["from_db"])
+        envelope = {"count": 1000, "total_pages": 20, "prev": None, "next": 2}
+        context = {**envelope, "results": results}
+        encoded = [serializers.dumps(row) for row in results]
+
+        modes = {
+            "stdlib": lambda: json.dumps(context, cls=DjangoJSONEncoder).encode(),
+            "pre-encoded": lambda: dumps_page(envelope, encoded),
+        }
+        if serializers.orjson is not None:
+            modes["orjson"] = lambda: serializers.orjson.dumps(
+                context, default=DjangoJSONEncoder().default
+            )
+        else:
+            self.stdout.write("orjson не установлен, режим пропущен")
+
+        self.stdout.write(f"Фильмов на странице: {len(results)}, полей: {len(DOCUMENT_FIELDS)}")
+        for name, func in modes.items():
+            seconds = timeit.timeit(func, number=options["number"])
+            self.stdout.write(
+                f"{name:12} {seconds / options['number'] * 1e6:10.1f} мкс/страница "
+                f"{len(func()):8} байт"
+            )
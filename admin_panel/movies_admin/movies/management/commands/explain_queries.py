@@ -0,0 +1,145 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from movies.api.v1.filters import SORT_FIELDS, get_sort
+from movies.catalogue import generate_catalogue
+from movies.documents import aggregate_films
+from movies.models import FilmWork, PersonFilmWork
+
+# индексы, которыми обязан пользоваться каждый запрос; --check падает, если план изменился
+EXPECTED_INDEXES = {
+    "api_list_deep_page": {"film_work_title_id_idx"},
+    "api_cursor_modified": {"film_work_modified_idx"},
+    "api_sort_title": {"film_work_title_id_idx"},
+    "api_sort_title_desc": {"film_work_title_id_idx"},
+    "api_sort_modified": {"film_work_modified_idx"},
+    "api_sort_modified_desc": {"film_work_modified_idx"},
+    "api_sort_rating": {"film_work_rating_idx"},
+    "api_sort_rating_desc": {"film_work_rating_desc_idx"},
+    "api_sort_creation_date": {"film_work_creation_date_idx"},
+    "api_sort_creation_date_desc": {"film_work_creation_date_desc_idx"},
+    "person_films_by_role": {"person_film_work_role_idx"},
+    "admin_search_title": {"film_work_title_trgm_idx", "film_work_description_trgm_idx"},
+    "changed_since": {"film_work_modified_idx"},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполняет EXPLAIN ANALYZE для запросов API и админки и показывает, какие индексы "
+        "они используют. С --films генерирует временный набор данных, который после "
+        "проверки откатывается."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--films", type=int, default=0,
+            help="сгенерировать столько фильмов перед проверкой (0 — использовать текущие данные)",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="seed генератора данных",
+        )
+        parser.add_argument(
+            "--check", action="store_true",
+            help="завершиться с ошибкой, если запрос не использует ожидаемые индексы",
+        )
+        parser.add_argument(
+            "--plans", action="store_true",
+            help="выводить полные планы запросов",
+        )
+
+    def generate(self, films: int, seed: int):
+        """Каталог с неравномерными распределениями, как у настоящих данных:
+        на равномерных данных планы бывают слишком оптимистичными."""
+        generate_catalogue(films=films, persons=films * 2, seed=seed)
+        # без свежей статистики планировщик считает таблицы почти пустыми
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def get_queries(self) -> dict:
+        """Запросы в том виде, в котором их выполняют API и админка."""
+        films = FilmWork.objects.all()
+        count = films.count()
+        ids = films.values_list("id", flat=True)
+        page_ids = ids.order_by("title", "id")
+        person_id = PersonFilmWork.objects.values_list("person_id", flat=True).first()
+        # граница, после которой изменился примерно 1% фильмов
+        since = (
+            films.order_by("-modified").values_list("modified", flat=True)[count // 100:].first()
+            or timezone.now()
+        )
+
+        return {
+            "api_list_deep_page": page_ids[count // 2:count // 2 + 50],
+            "api_list_page_aggregation": aggregate_films(
+                FilmWork.objects.filter(id__in=list(page_ids[:50]))
+            ),
+            "api_cursor_modified": ids.filter(modified__gt=since).order_by("modified", "id")[:51],
+            # сортировка строится так же, как для ?sort= в API
+            **{
+                f"api_sort_{field}{suffix}": ids.order_by(*get_sort({"sort": sort}, ()))[:50]
+                for field in SORT_FIELDS
+                for sort, suffix in ((field, ""), (f"-{field}", "_desc"))
+            },
+            "person_films_by_role": PersonFilmWork.objects.filter(
+                person_id=person_id, role="actor"
+            ),
+            "admin_search_title": films.filter(
+                Q(title__icontains="film 42") | Q(description__icontains="film 42")
+            ),
+            "changed_since": ids.filter(modified__gte=since),
+        }
+
+    @staticmethod
+    def walk(plan: dict):
+        yield plan
+        for child in plan.get("Plans", []):
+            yield from Command.walk(child)
+
+    def explain(self, name: str, queryset, options: dict) -> bool:
+        # QuerySet.explain() в Django 3.1 отдаёт план в виде repr, а не JSON
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params)
+            result = cursor.fetchone()[0][0]
+        nodes = list(self.walk(result["Plan"]))
+        indexes = {node["Index Name"] for node in nodes if "Index Name" in node}
+        seq_scans = sorted(
+            {node["Relation Name"] for node in nodes if node["Node Type"] == "Seq Scan"}
+        )
+
+        expected = EXPECTED_INDEXES.get(name, set())
+        missing = expected - indexes
+        style = self.style.ERROR if missing else self.style.SUCCESS
+        self.stdout.write(style(
+            f"{name}: {result['Execution Time']:.2f} ms, "
+            f"строк {result['Plan']['Actual Rows']}, "
+            f"индексы: {', '.join(sorted(indexes)) or '-'}, "
+            f"seq scan: {', '.join(seq_scans) or '-'}"
+        ))
+        if missing:
+            self.stdout.write(self.style.ERROR(f"  не используются: {', '.join(sorted(missing))}"))
+        if options["plans"]:
+            self.stdout.write(json.dumps(result["Plan"], indent=2))
+
+        return not missing
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options["films"]:
+                self.generate(options["films"], options["seed"])
+
+            results = [
+                self.explain(name, queryset, options)
+                for name, queryset in self.get_queries().items()
+            ]
+            # сгенерированные данные не должны остаться в базе
+            transaction.set_rollback(True)
+
+        if options["check"] and not all(results):
+            raise CommandError("планы запросов не используют ожидаемые индексы")
@@ -0,0 +1,58 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.api.v1.exceptions import InvalidParameter
+from movies.api.v1.filters import get_fields
+from movies.documents import document_values
+from movies.export import gzip_stream, iter_ndjson
+from movies.models import FilmWork, FilmWorkDocument
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгружает весь каталог фильмов в формате NDJSON: по документу API в строке. "
+        "Читает серверным курсором, поэтому память не зависит от размера каталога."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", default="-",
+            help="файл для выгрузки, - — стандартный вывод",
+        )
+        parser.add_argument(
+            "--gzip", action="store_true",
+            help="сжать выгрузку gzip",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=2000,
+            help="сколько строк читать из курсора за раз",
+        )
+        parser.add_argument(
+            "--fields",
+            help="поля документа через запятую, как ?fields= в API",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            fields = get_fields({"fields": options["fields"]} if options["fields"] else {})
+        except InvalidParameter as e:
+            raise CommandError(str(e))
+
+        model = FilmWorkDocument if settings.MOVIES_API_USE_DOCUMENTS else FilmWork
+        queryset = document_values(model.objects.order_by("id"), fields)
+        chunks = iter_ndjson(queryset, chunk_size=options["chunk_size"])
+        if options["gzip"]:
+            chunks = gzip_stream(chunks)
+
+        if options["output"] == "-":
+            output = sys.stdout.buffer
+        else:
+            output = open(options["output"], "wb")
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
@@ -0,0 +1,76 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from movies.catalogue import COPY_BATCH_SIZE, generate_catalogue
+from movies.documents import refresh_documents
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует синтетический каталог с неравномерными распределениями (несколько "
+        "очень занятых актёров, длинный хвост жанров) и загружает его командой COPY. "
+        "При одинаковом --seed данные одинаковые, поэтому замеры можно сравнивать."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--films", type=int, default=10000,
+            help="сколько фильмов сгенерировать (до умножения на --scale)",
+        )
+        parser.add_argument(
+            "--persons", type=int,
+            help="сколько людей сгенерировать (до умножения на --scale), "
+                 "по умолчанию вдвое больше фильмов",
+        )
+        parser.add_argument(
+            "--genres", type=int, default=50,
+            help="сколько жанров сгенерировать",
+        )
+        parser.add_argument(
+            "--credits", type=int, default=8,
+            help="среднее число людей у фильма",
+        )
+        parser.add_argument(
+            "--scale", type=float, default=1,
+            help="множитель количества фильмов и людей",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="seed генератора данных",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=COPY_BATCH_SIZE,
+            help="сколько строк отправлять в одной команде COPY",
+        )
+        parser.add_argument(
+            "--refresh-documents", action="store_true",
+            help="после загрузки пересобрать таблицу film_work_document",
+        )
+
+    def handle(self, *args, **options):
+        films = int(options["films"] * options["scale"])
+        persons = int((options["persons"] or options["films"] * 2) * options["scale"])
+        if films < 1 or persons < 1 or options["genres"] < 1 or options["credits"] < 1:
+            raise CommandError(
+                "количество фильмов, людей, жанров и участников должно быть больше 0"
+            )
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            counts = generate_catalogue(
+                films=films,
+                persons=persons,
+                genres=options["genres"],
+                credits=options["credits"],
+                seed=options["seed"],
+                batch_size=options["batch_size"],
+            )
+        for table, count in counts.items():
+            self.stdout.write(f"{table}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"Загружено за {time.perf_counter() - started:.1f} с"))
+
+        if options["refresh_documents"]:
+            count = refresh_documents()
+            self.stdout.write(self.style.SUCCESS(f"Записано документов: {count}"))
@@ -0,0 +1,68 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест HTTP API: отправляет --requests запросов в --concurrency потоков "
+        "и выводит RPS и перцентили времени ответа. Чтобы сравнить переиспользование "
+        "соединений с БД, запустите его против web с DB_CONN_MAX_AGE=0 и с DB_CONN_MAX_AGE=60 "
+        "или с DB_HOST=db и DB_HOST=pgbouncer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url", action="append",
+            help="адрес для запросов, можно указать несколько; по умолчанию список фильмов "
+                 "напрямую у gunicorn, мимо кэша nginx",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=1000,
+            help="сколько запросов отправить",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=10,
+            help="сколько запросов выполнять одновременно",
+        )
+
+    @staticmethod
+    def fetch(url: str):
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except OSError:
+            status = None
+
+        return status, time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        urls = options["url"] or ["http://localhost:8000/api/v1/movies/"]
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests и --concurrency должны быть больше 0")
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options["concurrency"]) as executor:
+            results = list(executor.map(
+                self.fetch, (urls[i % len(urls)] for i in range(options["requests"]))
+            ))
+        elapsed = time.perf_counter() - started
+
+        timings = sorted(t * 1000 for status, t in results if status == 200)
+        errors = len(results) - len(timings)
+        self.stdout.write(f"запросов: {len(results)}, ошибок: {errors}, за {elapsed:.2f} с")
+        self.stdout.write(f"RPS: {len(results) / elapsed:.1f}")
+        if len(timings) > 1:
+            percentiles = statistics.quantiles(timings, n=100)
+            self.stdout.write(
+                f"мс: p50 {percentiles[49]:.1f}, p95 {percentiles[94]:.1f}, "
+                f"p99 {percentiles[98]:.1f}, max {timings[-1]:.1f}"
+            )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from movies.profiling import make_profile_token
+
+
+class Command(BaseCommand):
+    help = (
+        "Выдаёт токен для заголовка X-Profile: запрос с ним профилируется "
+        "(см. movies.profiling.ProfilingMiddleware). Срок действия — PROFILING_TOKEN_MAX_AGE."
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_profile_token())
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from movies.models import FilmWorkChange
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет старые записи журнала изменений film_work_change. Потребители ленты "
+        "/api/v1/movies/changes/, отставшие больше чем на --days, должны заново выгрузить каталог."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=30,
+            help="сколько дней хранить записи",
+        )
+
+    def handle(self, *args, **options):
+        border = timezone.now() - timedelta(days=options["days"])
+        count, _ = FilmWorkChange.objects.filter(created__lt=border).delete()
+        self.stdout.write(self.style.SUCCESS(f"Удалено записей: {count}"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from movies.documents import refresh_documents
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобирает таблицу film_work_document. Нужно запускать после загрузки данных "
+        "в обход Django (например, load_data.py), так как сигналы при этом не срабатывают."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="сколько фильмов агрегировать за один запрос",
+        )
+
+    def handle(self, *args, **options):
+        count = refresh_documents(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Записано документов: {count}"))
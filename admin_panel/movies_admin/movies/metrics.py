@@ -0,0 +1,308 @@
+import bisect
+import fcntl
+import functools
+import hmac
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+from movies.api.cache import response_cache
+
+# границы корзин гистограмм
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+
+_local = threading.local()
+
+
+class Histogram:
+    """Гистограмма Prometheus с метками: количество наблюдений по корзинам и их сумма."""
+
+    def __init__(self, name: str, help_text: str, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.counts = defaultdict(lambda: [0] * (len(buckets) + 1))
+        self.sums = defaultdict(float)
+
+    def observe(self, labels: tuple, value: float):
+        self.counts[labels][bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def snapshot(self) -> list:
+        return [[list(labels), counts, self.sums[labels]] for labels, counts in self.counts.items()]
+
+    def merge(self, snapshot: list):
+        for labels, counts, total in snapshot:
+            merged = self.counts[tuple(labels)]
+            for i, count in enumerate(counts):
+                merged[i] += count
+            self.sums[tuple(labels)] += total
+
+    def render(self, label_names) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, counts in sorted(self.counts.items()):
+            base = ",".join(f'{name}="{value}"' for name, value in zip(label_names, labels))
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                total += count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {total}')
+            lines.append(f"{self.name}_sum{{{base}}} {self.sums[labels]}")
+            lines.append(f"{self.name}_count{{{base}}} {total}")
+
+        return lines
+
+
+def make_histograms() -> dict:
+    return {
+        "duration": Histogram(
+            "http_request_duration_seconds", "Время обработки запроса", DURATION_BUCKETS
+        ),
+        "db_queries": Histogram(
+            "http_request_db_queries", "Количество запросов к БД за запрос", QUERY_BUCKETS
+        ),
+        "db_time": Histogram(
+            "http_request_db_seconds", "Время запросов к БД за запрос", DURATION_BUCKETS
+        ),
+        "serialize": Histogram(
+            "http_request_serialize_seconds", "Время кодирования ответа в JSON", DURATION_BUCKETS
+        ),
+        "size": Histogram(
+            "http_response_size_bytes", "Размер ответа", SIZE_BUCKETS
+        ),
+    }
+
+
+def merge_snapshots(snapshots) -> dict:
+    histograms = make_histograms()
+    cache = defaultdict(int)
+    for snapshot in snapshots:
+        for name, entries in snapshot["histograms"].items():
+            histograms[name].merge(entries)
+        for name, value in snapshot["cache"].items():
+            cache[name] += value
+
+    return {
+        "histograms": {name: histogram.snapshot() for name, histogram in histograms.items()},
+        "cache": dict(cache),
+    }
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+def _read(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write(path: str, snapshot: dict):
+    # запись во временный файл и замена: читатель не увидит файл наполовину
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, path)
+
+
+def collect_snapshots(directory: str) -> list:
+    """Метрики всех воркеров из каталога METRICS_DIR. Файлы завершившихся воркеров
+    (gunicorn перезапускает их после max_requests) сливаются в archive.json, чтобы
+    счётчики не уменьшались, а число файлов не росло."""
+    with open(os.path.join(directory, "lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(directory, "archive.json")
+        archive = [_read(archive_path)] if os.path.exists(archive_path) else []
+        snapshots, dead = [], []
+        for name in os.listdir(directory):
+            pid, ext = os.path.splitext(name)
+            if ext != ".json" or not pid.isdigit():
+                continue
+            path = os.path.join(directory, name)
+            if _is_alive(int(pid)):
+                snapshots.append(_read(path))
+            else:
+                archive.append(_read(path))
+                dead.append(path)
+
+        if dead:
+            archive = [merge_snapshots(archive)]
+            _write(archive_path, archive[0])
+            for path in dead:
+                os.remove(path)
+
+    return snapshots + archive
+
+
+class Registry:
+    """Метрики запросов. Каждый воркер gunicorn копит их в своей памяти. Если задан
+    METRICS_DIR, воркер не реже раза в flush_interval секунд сохраняет их в файл
+    <pid>.json, а /metrics складывает файлы всех воркеров (как multiprocess-режим
+    prometheus_client), на какой бы воркер ни попал запрос. Без METRICS_DIR /metrics
+    отдаёт метрики только ответившего процесса.
+    """
+
+    label_names = ("view", "method")
+    flush_interval = 1.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = make_histograms()
+        self._flushed = 0.0
+
+    def observe(self, view: str, method: str, values: dict):
+        labels = (view, method)
+        with self._lock:
+            for name, value in values.items():
+                self.histograms[name].observe(labels, value)
+            flush = time.monotonic() - self._flushed >= self.flush_interval
+            if flush:
+                self._flushed = time.monotonic()
+
+        if flush and settings.METRICS_DIR:
+            self.flush(settings.METRICS_DIR)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = {name: histogram.snapshot() for name, histogram in self.histograms.items()}
+
+        return {"histograms": histograms, "cache": response_cache.stats()}
+
+    def flush(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        _write(os.path.join(directory, f"{os.getpid()}.json"), self.snapshot())
+
+    def render(self) -> str:
+        directory = settings.METRICS_DIR
+        if directory:
+            self.flush(directory)
+            snapshot = merge_snapshots(collect_snapshots(directory))
+        else:
+            snapshot = self.snapshot()
+
+        lines = []
+        for name, histogram in make_histograms().items():
+            histogram.merge(snapshot["histograms"].get(name, []))
+            lines.extend(histogram.render(self.label_names))
+        for name in ("hits", "misses"):
+            lines.append(f"# TYPE movies_api_cache_{name}_total counter")
+            lines.append(f"movies_api_cache_{name}_total {snapshot['cache'].get(name, 0)}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class RequestMetrics:
+    """Счётчики одного запроса: запросы к БД (через execute_wrapper) и этапы из timed."""
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.stages = defaultdict(float)
+        self.active = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.db_queries += 1
+
+
+def timed(stage: str):
+    """Учитывает время функции в этапе stage текущего запроса. Вложенные вызовы
+    того же этапа (например, dumps внутри dumps_page) не считаются повторно."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            metrics = getattr(_local, "metrics", None)
+            if metrics is None or stage in metrics.active:
+                return func(*args, **kwargs)
+
+            metrics.active.add(stage)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.stages[stage] += time.perf_counter() - started
+                metrics.active.discard(stage)
+
+        return wrapper
+
+    return decorator
+
+
+class MetricsMiddleware:
+    """Замеряет каждый запрос: общее время, количество и время запросов к БД, время
+    кодирования JSON и размер ответа. Отдаёт их в заголовке Server-Timing и копит
+    гистограммы для /metrics. Стоимость — несколько вызовов perf_counter на запрос
+    и на запрос к БД, поэтому middleware можно держать включённым под нагрузкой.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        _local.metrics = metrics
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _local.metrics = None
+        duration = time.perf_counter() - started
+
+        serialize = metrics.stages["serialize"]
+        response["Server-Timing"] = ", ".join((
+            f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.db_queries} queries"',
+            f"serialize;dur={serialize * 1000:.1f}",
+            f"total;dur={duration * 1000:.1f}",
+        ))
+
+        values = {
+            "duration": duration,
+            "db_queries": metrics.db_queries,
+            "db_time": metrics.db_time,
+            "serialize": serialize,
+        }
+        if not response.streaming:
+            values["size"] = len(response.content)
+
+        match = getattr(request, "resolver_match", None)
+        registry.observe(match.route if match else "unmatched", request.method, values)
+
+        return response
+
+
+def metrics_view(request):
+    """Метрики в текстовом формате Prometheus. Если задан METRICS_TOKEN, нужен заголовок
+    Authorization: Bearer <token>."""
+    token = settings.METRICS_TOKEN
+    if token:
+        expected = f"Bearer {token}"
+        if not hmac.compare_digest(request.META.get("HTTP_AUTHORIZATION", ""), expected):
+            return HttpResponse(status=403)
+
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4")
@@ -0,0 +1,41 @@
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilmWorkDocument',
+            fields=[
+                ('id', models.UUIDField(primary_key=True, serialize=False, verbose_name='id')),
+                ('title', models.CharField(max_length=255, verbose_name='название')),
+                ('description', models.TextField(blank=True, verbose_name='описание')),
+                ('creation_date', models.DateField(blank=True, null=True, verbose_name='дата создания фильма')),
+                ('rating', models.FloatField(blank=True, null=True, verbose_name='рейтинг')),
+                ('type', models.TextField(blank=True, verbose_name='тип')),
+                ('actors', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), default=list, size=None, verbose_name='актёры')),
+                ('directors', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), default=list, size=None, verbose_name='режиссёры')),
+                ('writers', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), default=list, size=None, verbose_name='сценаристы')),
+                ('genres', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), default=list, size=None, verbose_name='жанры')),
+                ('modified', models.DateTimeField(verbose_name='modified')),
+            ],
+            options={
+                'verbose_name': 'документ кинопроизведения',
+                'verbose_name_plural': 'документы кинопроизведений',
+                'db_table': 'content"."film_work_document',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='filmworkdocument',
+            index=models.Index(fields=['title', 'id'], name='film_work_document_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filmworkdocument',
+            index=models.Index(fields=['modified', 'id'], name='film_work_document_mod_idx'),
+        ),
+    ]
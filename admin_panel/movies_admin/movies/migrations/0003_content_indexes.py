@@ -0,0 +1,55 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_filmworkdocument'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['modified'], name='person_modified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='genre',
+            index=models.Index(fields=['modified'], name='genre_modified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filmwork',
+            index=models.Index(fields=['title', 'id'], name='film_work_title_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filmwork',
+            index=models.Index(fields=['rating'], name='film_work_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filmwork',
+            index=models.Index(fields=['creation_date'], name='film_work_creation_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filmwork',
+            index=models.Index(fields=['modified'], name='film_work_modified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='personfilmwork',
+            index=models.Index(fields=['person', 'role'], name='person_film_work_role_idx'),
+        ),
+        # icontains в поиске админки превращается в UPPER(col) LIKE UPPER('%...%'),
+        # поэтому триграммные индексы строятся по тому же выражению
+        migrations.RunSQL(
+            sql=[
+                'CREATE INDEX film_work_title_trgm_idx ON content.film_work '
+                'USING gin (UPPER(title) gin_trgm_ops)',
+                'CREATE INDEX film_work_description_trgm_idx ON content.film_work '
+                'USING gin (UPPER(description) gin_trgm_ops)',
+            ],
+            reverse_sql=[
+                'DROP INDEX content.film_work_title_trgm_idx',
+                'DROP INDEX content.film_work_description_trgm_idx',
+            ],
+        ),
+    ]
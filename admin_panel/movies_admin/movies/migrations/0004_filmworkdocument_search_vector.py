@@ -0,0 +1,38 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0003_content_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filmworkdocument',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='поисковый вектор'),
+        ),
+        migrations.AddIndex(
+            model_name='filmworkdocument',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='film_work_document_search_idx'),
+        ),
+        # заполняем вектор для уже собранных документов так же, как movies.documents.search_vector
+        # с конфигурацией по умолчанию (MOVIES_SEARCH_CONFIG = "english")
+        migrations.RunSQL(
+            sql="""
+            UPDATE content.film_work_document SET search_vector =
+                setweight(to_tsvector('english', coalesce(title, '')), 'A')
+                || setweight(to_tsvector('english', array_to_string(genres, ' ')), 'B')
+                || setweight(to_tsvector('english', concat_ws(' ',
+                    array_to_string(actors, ' '),
+                    array_to_string(directors, ' '),
+                    array_to_string(writers, ' ')
+                )), 'B')
+                || setweight(to_tsvector('english', coalesce(description, '')), 'C')
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
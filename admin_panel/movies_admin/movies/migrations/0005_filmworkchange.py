@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_filmworkdocument_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilmWorkChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('film_work_id', models.UUIDField(verbose_name='id кинопроизведения')),
+                ('deleted', models.BooleanField(default=False, verbose_name='удалено')),
+                ('transaction_id', models.BigIntegerField(verbose_name='id транзакции')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='дата создания')),
+            ],
+            options={
+                'verbose_name': 'изменение кинопроизведения',
+                'verbose_name_plural': 'изменения кинопроизведений',
+                'db_table': 'content"."film_work_change',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='filmworkchange',
+            index=models.Index(fields=['transaction_id', 'id'], name='film_work_change_txid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filmworkchange',
+            index=models.Index(fields=['created'], name='film_work_change_created_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_filmworkchange'),
+    ]
+
+    operations = [
+        # поиск людей и жанров в админке и в автодополнении инлайнов
+        migrations.RunSQL(
+            sql=[
+                'CREATE INDEX person_full_name_trgm_idx ON content.person '
+                'USING gin (UPPER(full_name) gin_trgm_ops)',
+                'CREATE INDEX genre_name_trgm_idx ON content.genre '
+                'USING gin (UPPER(name) gin_trgm_ops)',
+            ],
+            reverse_sql=[
+                'DROP INDEX content.person_full_name_trgm_idx',
+                'DROP INDEX content.genre_name_trgm_idx',
+            ],
+        ),
+    ]
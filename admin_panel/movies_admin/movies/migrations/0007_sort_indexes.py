@@ -0,0 +1,92 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_admin_search_indexes'),
+    ]
+
+    operations = [
+        # API сортирует по (поле NULLS LAST, id): индекс по одному полю не даёт
+        # однозначного порядка, а обратный проход по нему ставит NULL в начало.
+        # Индексы создаются и удаляются через RunSQL: RemoveIndex удаляет индекс
+        # по имени без схемы и не находит его в content
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='filmwork',
+                    name='film_work_rating_idx',
+                ),
+                migrations.RemoveIndex(
+                    model_name='filmwork',
+                    name='film_work_creation_date_idx',
+                ),
+                migrations.AddIndex(
+                    model_name='filmwork',
+                    index=models.Index(fields=['rating', 'id'], name='film_work_rating_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='filmwork',
+                    index=models.Index(
+                        fields=['creation_date', 'id'], name='film_work_creation_date_idx'
+                    ),
+                ),
+                migrations.AddIndex(
+                    model_name='filmworkdocument',
+                    index=models.Index(
+                        fields=['rating', 'id'], name='film_work_document_rating_idx'
+                    ),
+                ),
+                migrations.AddIndex(
+                    model_name='filmworkdocument',
+                    index=models.Index(
+                        fields=['creation_date', 'id'], name='film_work_document_date_idx'
+                    ),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    sql=[
+                        'DROP INDEX content.film_work_rating_idx',
+                        'DROP INDEX content.film_work_creation_date_idx',
+                        'CREATE INDEX film_work_rating_idx ON content.film_work (rating, id)',
+                        'CREATE INDEX film_work_creation_date_idx ON content.film_work '
+                        '(creation_date, id)',
+                        'CREATE INDEX film_work_document_rating_idx ON content.film_work_document '
+                        '(rating, id)',
+                        'CREATE INDEX film_work_document_date_idx ON content.film_work_document '
+                        '(creation_date, id)',
+                    ],
+                    reverse_sql=[
+                        'DROP INDEX content.film_work_rating_idx',
+                        'DROP INDEX content.film_work_creation_date_idx',
+                        'DROP INDEX content.film_work_document_rating_idx',
+                        'DROP INDEX content.film_work_document_date_idx',
+                        'CREATE INDEX film_work_rating_idx ON content.film_work (rating)',
+                        'CREATE INDEX film_work_creation_date_idx ON content.film_work '
+                        '(creation_date)',
+                    ],
+                ),
+            ],
+        ),
+        # DESC NULLS LAST в Django 3.1 не задать через models.Index
+        migrations.RunSQL(
+            sql=[
+                'CREATE INDEX film_work_rating_desc_idx ON content.film_work '
+                '(rating DESC NULLS LAST, id)',
+                'CREATE INDEX film_work_creation_date_desc_idx ON content.film_work '
+                '(creation_date DESC NULLS LAST, id)',
+                'CREATE INDEX film_work_document_rating_desc_idx ON content.film_work_document '
+                '(rating DESC NULLS LAST, id)',
+                'CREATE INDEX film_work_document_date_desc_idx ON content.film_work_document '
+                '(creation_date DESC NULLS LAST, id)',
+            ],
+            reverse_sql=[
+                'DROP INDEX content.film_work_rating_desc_idx',
+                'DROP INDEX content.film_work_creation_date_desc_idx',
+                'DROP INDEX content.film_work_document_rating_desc_idx',
+                'DROP INDEX content.film_work_document_date_desc_idx',
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_sort_indexes'),
+    ]
+
+    operations = [
+        # ?sort=modified и -modified упорядочивают по (modified, id), индекс по одному
+        # modified не избавляет от сортировки. Индекс пересоздаётся через RunSQL,
+        # как в 0007: RemoveIndex не находит индекс в схеме content
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='filmwork',
+                    name='film_work_modified_idx',
+                ),
+                migrations.AddIndex(
+                    model_name='filmwork',
+                    index=models.Index(fields=['modified', 'id'], name='film_work_modified_idx'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    sql=[
+                        'DROP INDEX content.film_work_modified_idx',
+                        'CREATE INDEX film_work_modified_idx ON content.film_work (modified, id)',
+                    ],
+                    reverse_sql=[
+                        'DROP INDEX content.film_work_modified_idx',
+                        'CREATE INDEX film_work_modified_idx ON content.film_work (modified)',
+                    ],
+                ),
+            ],
+        ),
+    ]
@@ -1,4 +1,7 @@
 import uuid
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator
@@ -16,6 +19,9 @@ class Person(TimeStampedModel):
         verbose_name = _("персона")
         verbose_name_plural = _("персоны")
         db_table = f'{CONTENT_SCHEMA}"."person'
+        indexes = [
+            models.Index(fields=["modified"], name="person_modified_idx"),
+        ]
 
     def __str__(self):
         return self.full_name
@@ -30,6 +36,9 @@ class Genre(TimeStampedModel):
         verbose_name = _("жанр")
         verbose_name_plural = _("жанры")
         db_table = f'{CONTENT_SCHEMA}"."genre'
+        indexes = [
+            models.Index(fields=["modified"], name="genre_modified_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -58,6 +67,14 @@ class FilmWork(TimeStampedModel):
         verbose_name = _("кинопроизведение")
         verbose_name_plural = _("кинопроизведения")
         db_table = f'{CONTENT_SCHEMA}"."film_work'
+        # триграммные индексы для поиска в админке заданы в миграции 0003 через RunSQL,
+        # индексы для сортировки по убыванию (DESC NULLS LAST, id) — в миграции 0007
+        indexes = [
+            models.Index(fields=["title", "id"], name="film_work_title_id_idx"),
+            models.Index(fields=["rating", "id"], name="film_work_rating_idx"),
+            models.Index(fields=["creation_date", "id"], name="film_work_creation_date_idx"),
+            models.Index(fields=["modified", "id"], name="film_work_modified_idx"),
+        ]
 
     def __str__(self):
         return self.title
@@ -81,6 +98,9 @@ class PersonFilmWork(models.Model):
         verbose_name_plural = _("участники кинопроизведения")
         db_table = f'{CONTENT_SCHEMA}"."person_film_work'
         unique_together = ("film_work", "person", "role")
+        indexes = [
+            models.Index(fields=["person", "role"], name="person_film_work_role_idx"),
+        ]
 
 
 class GenreFilmWork(models.Model):
@@ -94,3 +114,62 @@ class GenreFilmWork(models.Model):
         verbose_name_plural = _("жанры кинопроизведения")
         db_table = f'{CONTENT_SCHEMA}"."genre_film_work'
         unique_together = ("film_work", "genre")
+
+
+class FilmWorkDocument(models.Model):
+    """Готовый для выдачи через API документ фильма: данные film_work вместе со списками
+    людей и жанров. Обновляется сигналами при изменении фильма и связанных с ним данных
+    (см. movies.signals), полностью пересобирается командой refresh_documents.
+    """
+    id = models.UUIDField(_("id"), primary_key=True)
+    title = models.CharField(_("название"), max_length=255)
+    description = models.TextField(_("описание"), blank=True)
+    creation_date = models.DateField(_("дата создания фильма"), null=True, blank=True)
+    rating = models.FloatField(_("рейтинг"), null=True, blank=True)
+    type = models.TextField(_("тип"), blank=True)
+    actors = ArrayField(models.TextField(), verbose_name=_("актёры"), default=list)
+    directors = ArrayField(models.TextField(), verbose_name=_("режиссёры"), default=list)
+    writers = ArrayField(models.TextField(), verbose_name=_("сценаристы"), default=list)
+    genres = ArrayField(models.TextField(), verbose_name=_("жанры"), default=list)
+    modified = models.DateTimeField(_("modified"))
+    # полнотекстовый индекс по названию, людям, жанрам и описанию
+    search_vector = SearchVectorField(_("поисковый вектор"), null=True, editable=False)
+
+    class Meta:
+        verbose_name = _("документ кинопроизведения")
+        verbose_name_plural = _("документы кинопроизведений")
+        db_table = f'{CONTENT_SCHEMA}"."film_work_document'
+        # индексы для сортировки по убыванию (DESC NULLS LAST, id) заданы в миграции 0007
+        indexes = [
+            models.Index(fields=["title", "id"], name="film_work_document_title_idx"),
+            models.Index(fields=["modified", "id"], name="film_work_document_mod_idx"),
+            models.Index(fields=["rating", "id"], name="film_work_document_rating_idx"),
+            models.Index(fields=["creation_date", "id"], name="film_work_document_date_idx"),
+            GinIndex(fields=["search_vector"], name="film_work_document_search_idx"),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class FilmWorkChange(models.Model):
+    """Журнал изменений фильмов для /api/v1/movies/changes/. Запись добавляется сигналами
+    в той же транзакции, что и само изменение, в том числе при изменении связанных людей,
+    жанров и при удалении фильма. transaction_id — номер транзакции PostgreSQL
+    (txid_current()), по нему и id строится курсор ленты.
+    """
+    id = models.BigAutoField(primary_key=True)
+    # без внешнего ключа: запись об удалении переживает сам фильм
+    film_work_id = models.UUIDField(_("id кинопроизведения"))
+    deleted = models.BooleanField(_("удалено"), default=False)
+    transaction_id = models.BigIntegerField(_("id транзакции"))
+    created = models.DateTimeField(_("дата создания"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("изменение кинопроизведения")
+        verbose_name_plural = _("изменения кинопроизведений")
+        db_table = f'{CONTENT_SCHEMA}"."film_work_change'
+        indexes = [
+            models.Index(fields=["transaction_id", "id"], name="film_work_change_txid_idx"),
+            models.Index(fields=["created"], name="film_work_change_created_idx"),
+        ]
@@ -0,0 +1,205 @@
+import cProfile
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core import signing
+from django.db import connections
+from django.http import FileResponse, Http404, JsonResponse
+from django.utils import timezone
+
+# заголовок с подписанным токеном из make_profile_token
+PROFILE_HEADER = "HTTP_X_PROFILE"
+SIGNING_SALT = "movies.profiling"
+# имена файлов профилей: <время>-<id>.<расширение>
+ARTIFACT_RE = re.compile(r"^[0-9T]+-[0-9a-f]{8}\.(pstats|collapsed|json)$")
+# таблицы с сессиями, паролями и токенами: параметры запросов к ним не сохраняются
+SENSITIVE_TABLES_RE = re.compile(r'"(django_session|auth_[a-z_]+|authtoken_[a-z_]+)"')
+
+
+def make_profile_token() -> str:
+    """Подписанный токен для заголовка X-Profile: позволяет профилировать запрос
+    без учётной записи сотрудника, пока не истечёт PROFILING_TOKEN_MAX_AGE."""
+    return signing.dumps("profile", salt=SIGNING_SALT)
+
+
+def _valid_token(token: str) -> bool:
+    try:
+        signing.loads(token, salt=SIGNING_SALT, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+
+    return True
+
+
+class StackSampler:
+    """Раз в interval секунд снимает стек потока, обрабатывающего запрос, и считает
+    одинаковые стеки. Результат — свёрнутые стеки (collapsed) для flamegraph.pl
+    и speedscope. В отличие от cProfile почти не замедляет сам запрос."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_filename}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    # enable/disable — как у cProfile.Profile
+    def enable(self):
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path: Path):
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in self.stacks.items()))
+
+
+class QueryLog:
+    """Запросы к БД за время профилирования, подключается через execute_wrapper.
+    Параметры сохраняются только при PROFILING_LOG_PARAMS и никогда — для таблиц
+    сессий и пользователей."""
+
+    def __init__(self):
+        self.queries = []
+        self.log_params = settings.PROFILING_LOG_PARAMS
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            logged = self.log_params and not SENSITIVE_TABLES_RE.search(sql)
+            self.queries.append({
+                "sql": sql,
+                "params": repr(params) if logged else None,
+                "ms": round((time.perf_counter() - started) * 1000, 3),
+            })
+
+
+class ProfilingMiddleware:
+    """Профилирует выбранные запросы к API и админке на рабочих данных.
+
+    Запрос профилируется, если он попал в долю PROFILING_SAMPLE_RATE, если у него есть
+    заголовок X-Profile с токеном из make_profile_token или если сотрудник добавил
+    параметр ?_profile=1. Профиль (pstats для cProfile или свёрнутые стеки для
+    сэмплера, см. PROFILING_MODE) и запросы к БД сохраняются в PROFILING_DIR,
+    их id возвращается в заголовке X-Profile-Id. Скачать профили можно на /profiles/.
+
+    Потоковые ответы (выгрузка, скачивание файлов) не профилируются: тело такого
+    ответа формируется уже после выхода из middleware, и профиль был бы пустым.
+
+    Должен стоять после AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    @staticmethod
+    def should_profile(request) -> bool:
+        if request.GET.get("_profile") == "1" and request.user.is_staff:
+            return True
+        if PROFILE_HEADER in request.META and _valid_token(request.META[PROFILE_HEADER]):
+            return True
+
+        rate = settings.PROFILING_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        profile_id = f"{timezone.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        directory = Path(settings.PROFILING_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        queries = QueryLog()
+        if settings.PROFILING_MODE == "sampler":
+            profiler = StackSampler(settings.PROFILING_SAMPLE_INTERVAL)
+        else:
+            profiler = cProfile.Profile()
+
+        try:
+            profiler.enable()
+        except ValueError:
+            # с Python 3.12 cProfile может работать только в одном потоке процесса
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with connections["default"].execute_wrapper(queries):
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - started
+
+        if response.streaming:
+            return response
+
+        if isinstance(profiler, StackSampler):
+            profiler.dump(directory / f"{profile_id}.collapsed")
+        else:
+            profiler.dump_stats(str(directory / f"{profile_id}.pstats"))
+        (directory / f"{profile_id}.json").write_text(json.dumps({
+            "path": request.get_full_path(),
+            "method": request.method,
+            "status": response.status_code,
+            "ms": round(duration * 1000, 3),
+            "mode": settings.PROFILING_MODE,
+            "queries": queries.queries,
+        }, indent=2))
+        prune_profiles(directory, settings.PROFILING_MAX_PROFILES)
+
+        response["X-Profile-Id"] = profile_id
+        return response
+
+
+def prune_profiles(directory: Path, keep: int):
+    """Оставляет только keep последних профилей."""
+    ids = sorted(
+        {path.name.split(".")[0] for path in directory.iterdir() if ARTIFACT_RE.match(path.name)}
+    )
+    for profile_id in ids[:max(len(ids) - keep, 0)]:
+        for path in directory.glob(f"{profile_id}.*"):
+            path.unlink()
+
+
+@staff_member_required
+def profile_list(request):
+    directory = Path(settings.PROFILING_DIR)
+    files = sorted(
+        (path.name for path in directory.iterdir() if ARTIFACT_RE.match(path.name)),
+        reverse=True,
+    ) if directory.is_dir() else []
+
+    return JsonResponse({"profiles": [f"/profiles/{name}" for name in files]})
+
+
+@staff_member_required
+def profile_download(request, name: str):
+    path = Path(settings.PROFILING_DIR) / name
+    # имя проверяется по шаблону, поэтому выйти за пределы PROFILING_DIR нельзя
+    if not ARTIFACT_RE.match(name) or not path.is_file():
+        raise Http404("профиль не найден")
+
+    return FileResponse(path.open("rb"), as_attachment=True, filename=name)
@@ -1,15 +1,138 @@
 import datetime
-from django.db.models.signals import post_save
+import logging
+from typing import Iterable
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import BigIntegerField, Func
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils import timezone
+
+from movies.api.cache import response_cache
+from movies.documents import DocumentRefresher, refresh_documents
+from movies.models import (
+    CONTENT_SCHEMA, FilmWork, FilmWorkChange, Genre, GenreFilmWork, Person, PersonFilmWork,
+)
+
+logger = logging.getLogger(__name__)
 
 
 def congratulatory(sender, instance, created, **kwargs):
     if created and instance.birth_date == datetime.date.today():
-        print(f"У {instance.full_name} сегодня день рождения! 🥳")
+        logger.info("У %s сегодня день рождения! 🥳", instance.full_name)
 
 
 post_save.connect(
     receiver=congratulatory,
-    sender="movie_admin.Person",
+    sender="movies.Person",
     weak=True,
     dispatch_uid="congratulatory_signal",
 )
+
+
+def create_content_schema(sender, using, **kwargs):
+    """Создаёт схему content перед миграциями, если её ещё нет, например в тестовой БД.
+    Миграция 0001_initial создаёт таблицы сразу в этой схеме, а в уже развёрнутых базах
+    схема создана скриптом schema_design.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {CONTENT_SCHEMA}")
+
+
+def films_changed(ids: Iterable, deleted: bool = False):
+    """Вызывается при любом изменении фильмов с указанными id, в том числе через
+    связанных с ними людей и жанры. Записывает изменения в журнал film_work_change
+    в текущей транзакции, а после её фиксации пересобирает документы фильмов
+    и сбрасывает закэшированные ответы API.
+    """
+    ids = set(ids)
+    if ids:
+        record_changes(ids, deleted)
+        transaction.on_commit(lambda: _refresh_films(ids))
+
+
+def record_changes(ids: Iterable, deleted: bool = False):
+    transaction_id = Func(function="txid_current", output_field=BigIntegerField())
+    FilmWorkChange.objects.bulk_create(
+        FilmWorkChange(film_work_id=pk, deleted=deleted, transaction_id=transaction_id)
+        for pk in ids
+    )
+
+
+# пересобирает документы и затем сбрасывает кэш ответов в фоновом потоке
+document_refresher = DocumentRefresher(response_cache.invalidate_films)
+
+
+def _refresh_films(ids):
+    # без таблицы документов API собирает фильмы из связанных таблиц
+    if not settings.MOVIES_API_USE_DOCUMENTS:
+        response_cache.invalidate_films(ids)
+    elif settings.MOVIES_API_DOCUMENTS_REFRESH == "background":
+        document_refresher.add(ids)
+    else:
+        refresh_documents(ids)
+        response_cache.invalidate_films(ids)
+
+
+def film_links_changed(ids: Iterable):
+    """Вызывается при изменении связей фильмов с людьми и жанрами. У таблиц связей нет
+    поля modified, поэтому оно обновляется у самих фильмов: по нему вычисляются
+    Last-Modified и ETag ответов API.
+    """
+    ids = set(ids)
+    FilmWork.objects.filter(pk__in=ids).update(modified=timezone.now())
+    films_changed(ids)
+
+
+def linked_film_ids(model, pk) -> list:
+    """id фильмов, связанных с человеком или жанром."""
+    if model is Person:
+        links = PersonFilmWork.objects.filter(person_id=pk)
+    else:
+        links = GenreFilmWork.objects.filter(genre_id=pk)
+
+    return list(links.values_list("film_work_id", flat=True))
+
+
+def film_work_changed(sender, instance, signal, **kwargs):
+    films_changed([instance.pk], deleted=signal is post_delete)
+
+
+def related_changed(sender, instance, signal, created=False, **kwargs):
+    # у нового человека или жанра ещё нет фильмов, а при удалении связи
+    # удаляются каскадно и обрабатываются в link_changed
+    if created or signal is post_delete:
+        return
+
+    films_changed(linked_film_ids(sender, instance.pk))
+
+
+def link_changed(sender, instance, **kwargs):
+    film_links_changed([instance.film_work_id])
+
+
+def m2m_links_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith("post_"):
+            film_links_changed([instance.pk])
+        return
+
+    # изменение со стороны человека или жанра: затронуты фильмы из pk_set,
+    # а при clear — все фильмы, связанные до очистки
+    if action == "pre_clear":
+        instance._cleared_film_ids = linked_film_ids(type(instance), instance.pk)
+    elif action == "post_clear":
+        film_links_changed(getattr(instance, "_cleared_film_ids", []))
+    elif action in ("post_add", "post_remove"):
+        film_links_changed(pk_set or [])
+
+
+for name, signal in (("save", post_save), ("delete", post_delete)):
+    signal.connect(film_work_changed, sender=FilmWork, dispatch_uid=f"film_work_{name}")
+    signal.connect(related_changed, sender=Person, dispatch_uid=f"person_{name}")
+    signal.connect(related_changed, sender=Genre, dispatch_uid=f"genre_{name}")
+    signal.connect(link_changed, sender=PersonFilmWork, dispatch_uid=f"person_film_work_{name}")
+    signal.connect(link_changed, sender=GenreFilmWork, dispatch_uid=f"genre_film_work_{name}")
+
+m2m_changed.connect(m2m_links_changed, sender=PersonFilmWork, dispatch_uid="person_film_work_m2m")
+m2m_changed.connect(m2m_links_changed, sender=GenreFilmWork, dispatch_uid="genre_film_work_m2m")
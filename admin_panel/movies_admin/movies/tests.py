@@ -1,3 +1,847 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from movies.admin import EstimatedCountPaginator
+from movies.api.cache import response_cache
+from movies.api.v1.filters import get_fields
+from movies.api.v1.pagination import encode_cursor
+from movies.api.v1.views import MoviesApiMixin
+from movies.catalogue import generate_catalogue
+from movies.documents import refresh_documents
+from movies.metrics import Registry
+from movies.profiling import QueryLog, make_profile_token
+from movies.signals import document_refresher
+from movies.models import FilmWork, FilmWorkDocument, Genre, Person, PersonFilmWork, GenreFilmWork
+
+
+def is_aggregation(sql: str) -> bool:
+    """Запрос собирает списки людей и жанров (любым способом из AGGREGATIONS)."""
+    return "ARRAY_AGG" in sql or "ARRAY(SELECT" in sql
+
+
+class MoviesApiTestCase(TestCase):
+    films_count = 60
+
+    @classmethod
+    def setUpTestData(cls):
+        genre = Genre.objects.create(name="Drama")
+        actor = Person.objects.create(full_name="Darrell Geer")
+        director = Person.objects.create(full_name="Turgut Turk Adiguzel")
+
+        films = FilmWork.objects.bulk_create(
+            FilmWork(title=f"Film {i:03}", type="film", rating=i / 10)
+            for i in range(cls.films_count)
+        )
+        PersonFilmWork.objects.bulk_create(
+            PersonFilmWork(film_work=film, person=person, role=role)
+            for film in films
+            for person, role in ((actor, "actor"), (director, "director"))
+        )
+        GenreFilmWork.objects.bulk_create(
+            GenreFilmWork(film_work=film, genre=genre) for film in films
+        )
+
+    def setUp(self):
+        caches[settings.MOVIES_API_CACHE].clear()
+
+
+class ContentTransactionTestCase(TransactionTestCase):
+    """flush в TransactionTestCase очищает только таблицы из search_path, поэтому
+    таблицы схемы content очищаются после каждого теста отдельно."""
+
+    def tearDown(self):
+        tables = ", ".join(
+            connection.ops.quote_name(model._meta.db_table)
+            for model in apps.get_app_config("movies").get_models()
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {tables} CASCADE")
+        super().tearDown()
+
+
+class MoviesApiPaginationTest(MoviesApiTestCase):
+    def test_first_page(self):
+        # валидатор ETag + count + id страницы + агрегация только по id страницы
+        with self.assertNumQueries(4):
+            response = self.client.get("/api/v1/movies/")
+
+        data = response.json()
+        self.assertEqual(data["count"], self.films_count)
+        self.assertEqual(data["total_pages"], 2)
+        self.assertIsNone(data["prev"])
+        self.assertEqual(data["next"], 2)
+        self.assertEqual(len(data["results"]), 50)
+        self.assertEqual(data["results"][0]["title"], "Film 000")
+        self.assertEqual(data["results"][0]["actors"], ["Darrell Geer"])
+        self.assertEqual(data["results"][0]["directors"], ["Turgut Turk Adiguzel"])
+        self.assertEqual(data["results"][0]["genres"], ["Drama"])
+
+    def test_last_page(self):
+        with self.assertNumQueries(4):
+            response = self.client.get("/api/v1/movies/", {"page": 2})
+
+        data = response.json()
+        self.assertEqual(data["prev"], 1)
+        self.assertIsNone(data["next"])
+        self.assertEqual(len(data["results"]), 10)
+        self.assertEqual(data["results"][-1]["title"], "Film 059")
+
+    def test_pages_do_not_overlap(self):
+        first = self.client.get("/api/v1/movies/").json()["results"]
+        second = self.client.get("/api/v1/movies/", {"page": 2}).json()["results"]
+
+        ids = {row["id"] for row in first} | {row["id"] for row in second}
+        self.assertEqual(len(ids), self.films_count)
+
+
+@override_settings(MOVIES_API_AGGREGATION="join")
+class MoviesApiJoinAggregationTest(MoviesApiPaginationTest):
+    def test_same_documents(self):
+        expected = self.client.get("/api/v1/movies/").json()
+        caches[settings.MOVIES_API_CACHE].clear()
+
+        with override_settings(MOVIES_API_AGGREGATION="subquery"):
+            self.assertEqual(self.client.get("/api/v1/movies/").json(), expected)
+
+
+@override_settings(MOVIES_API_USE_DOCUMENTS=True)
+class MoviesApiDocumentsTest(MoviesApiPaginationTest):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        refresh_documents()
+
+    def test_documents_match_aggregation(self):
+        self.assertEqual(FilmWorkDocument.objects.count(), self.films_count)
+        from_documents = self.client.get("/api/v1/movies/").json()
+
+        caches[settings.MOVIES_API_CACHE].clear()
+        with self.settings(MOVIES_API_USE_DOCUMENTS=False):
+            aggregated = self.client.get("/api/v1/movies/").json()
+
+        self.assertEqual(from_documents, aggregated)
+
+
+class MoviesApiCursorTest(MoviesApiTestCase):
+    def test_walk_catalogue(self):
+        with CaptureQueriesContext(connection) as queries:
+            first = self.client.get("/api/v1/movies/", {"cursor": ""}).json()
+
+        # валидатор ETag + ключи страницы + агрегация, без COUNT(*) и OFFSET
+        self.assertEqual(len(queries), 3)
+        self.assertFalse(any("OFFSET" in q["sql"] for q in queries))
+        self.assertIsNone(first["count"])
+        self.assertIsNone(first["prev"])
+        self.assertEqual(len(first["results"]), 50)
+
+        second = self.client.get("/api/v1/movies/", {"cursor": first["next"]}).json()
+        self.assertIsNone(second["next"])
+        self.assertEqual(len(second["results"]), 10)
+        self.assertEqual(second["results"][0]["title"], "Film 050")
+
+        back = self.client.get("/api/v1/movies/", {"cursor": second["prev"]}).json()
+        self.assertEqual(back["results"], first["results"])
+        self.assertIsNone(back["prev"])
+
+    def test_descending_modified(self):
+        params = {"cursor": "", "sort": "-modified", "count": "exact"}
+        first = self.client.get("/api/v1/movies/", params).json()
+        self.assertEqual(first["count"], self.films_count)
+
+        params["cursor"] = first["next"]
+        second = self.client.get("/api/v1/movies/", params).json()
+        ids = {row["id"] for row in first["results"] + second["results"]}
+        self.assertEqual(len(ids), self.films_count)
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/v1/movies/", {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 400)
+
+        first = self.client.get("/api/v1/movies/", {"cursor": ""}).json()
+        response = self.client.get("/api/v1/movies/", {"cursor": first["next"], "sort": "modified"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_tampered_cursor(self):
+        film_id = str(FilmWork.objects.first().pk)
+        for sort, key in (
+            ("title", ["A", "not-a-uuid"]),
+            ("title", ["A\x00", film_id]),
+            ("title", [1, film_id]),
+            ("modified", ["garbage", film_id]),
+            ("-modified", ["2021-01-01T00:00:00+00:00"]),
+        ):
+            cursor = encode_cursor({"s": sort, "d": "n", "k": key})
+            response = self.client.get("/api/v1/movies/", {"cursor": cursor, "sort": sort})
+            self.assertEqual(response.status_code, 400, key)
+
+
+class MoviesApiCacheTest(ContentTransactionTestCase):
+    def setUp(self):
+        caches[settings.MOVIES_API_CACHE].clear()
+        self.film = FilmWork.objects.create(title="Crescent Star", type="film")
+        self.url = f"/api/v1/movies/{self.film.pk}/"
+
+    def test_hit_without_aggregation(self):
+        # ETag/Last-Modified и одна агрегация фильма
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Cache"], "MISS")
+
+        # остаётся только дешёвый запрос для ETag/Last-Modified
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.json()["title"], "Crescent Star")
+
+    def test_invalidated_by_related_change(self):
+        self.client.get(self.url)
+        self.client.get("/api/v1/movies/")
+
+        person = Person.objects.create(full_name="Darrell Geer")
+        PersonFilmWork.objects.create(film_work=self.film, person=person, role="actor")
+
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["actors"], ["Darrell Geer"])
+        self.assertEqual(self.client.get("/api/v1/movies/")["X-Cache"], "MISS")
+
+        person.full_name = "Michael Bond"
+        person.save()
+        self.assertEqual(self.client.get(self.url).json()["actors"], ["Michael Bond"])
+
+    @override_settings(MOVIES_API_USE_DOCUMENTS=True, MOVIES_API_DOCUMENTS_REFRESH="commit")
+    def test_documents_refreshed_on_commit(self):
+        self.client.get(self.url)
+
+        person = Person.objects.create(full_name="Darrell Geer")
+        PersonFilmWork.objects.create(film_work=self.film, person=person, role="actor")
+
+        self.assertEqual(FilmWorkDocument.objects.get(pk=self.film.pk).actors, ["Darrell Geer"])
+        self.assertEqual(self.client.get(self.url).json()["actors"], ["Darrell Geer"])
+
+    @override_settings(MOVIES_API_USE_DOCUMENTS=True, MOVIES_API_DOCUMENTS_REFRESH="background")
+    def test_documents_refreshed_in_background(self):
+        self.client.get(self.url)
+
+        person = Person.objects.create(full_name="Darrell Geer")
+        PersonFilmWork.objects.create(film_work=self.film, person=person, role="actor")
+        document_refresher.wait()
+
+        self.assertEqual(FilmWorkDocument.objects.get(pk=self.film.pk).actors, ["Darrell Geer"])
+        self.assertEqual(self.client.get(self.url).json()["actors"], ["Darrell Geer"])
+
+    def test_documents_not_refreshed_when_disabled(self):
+        self.client.get(self.url)
+
+        PersonFilmWork.objects.create(
+            film_work=self.film,
+            person=Person.objects.create(full_name="Darrell Geer"),
+            role="actor",
+        )
+
+        self.assertFalse(FilmWorkDocument.objects.filter(pk=self.film.pk).exists())
+        self.assertEqual(self.client.get(self.url).json()["actors"], ["Darrell Geer"])
+
+
+class MoviesApiSerializerTest(MoviesApiTestCase):
+    def test_documents_reused(self):
+        expected = self.client.get("/api/v1/movies/").json()["results"]
+
+        # другой ключ ответа, но документы страницы уже закодированы: нет агрегации
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/v1/movies/?type=film")
+        self.assertEqual(response.json()["results"], expected)
+
+    def test_documents_not_cached_under_newer_version(self):
+        film = FilmWork.objects.order_by("title").first()
+        fields = get_fields({})
+        encode = MoviesApiMixin.encode_documents
+
+        def encode_then_invalidate(view, ids):
+            documents = encode(view, ids)
+            # фильм изменился, пока документы читались из БД
+            response_cache.invalidate_films([film.pk])
+            return documents
+
+        with mock.patch.object(MoviesApiMixin, "encode_documents", encode_then_invalidate):
+            self.client.get(f"/api/v1/movies/{film.pk}/")
+
+        keys = response_cache.document_keys([film.pk], fields)
+        self.assertEqual(response_cache.get_documents(keys), {})
+
+    def test_stdlib_matches_default(self):
+        expected = self.client.get("/api/v1/movies/?page=2").json()
+        caches[settings.MOVIES_API_CACHE].clear()
+
+        with override_settings(MOVIES_API_SERIALIZER="stdlib"):
+            self.assertEqual(self.client.get("/api/v1/movies/?page=2").json(), expected)
+
+
+class MoviesApiSqlRenderingTest(MoviesApiTestCase):
+    def test_same_documents(self):
+        film = FilmWork.objects.order_by("title").first()
+        urls = (
+            "/api/v1/movies/?page=2",
+            "/api/v1/movies/?fields=title,genres",
+            f"/api/v1/movies/{film.pk}/",
+        )
+        expected = [self.client.get(url).content for url in urls]
+        caches[settings.MOVIES_API_CACHE].clear()
+
+        # совпадают байты, а не только разобранный JSON, в том числе у рейтинга 5.0
+        with override_settings(MOVIES_API_RENDERING="sql"):
+            self.assertEqual([self.client.get(url).content for url in urls], expected)
+        self.assertIn(b'"rating":5.0,', expected[0])
+
+    @override_settings(MOVIES_API_SERIALIZER="stdlib")
+    def test_same_bytes_without_orjson(self):
+        film = FilmWork.objects.create(title="Тест Türk", description="«кавычки»\n", rating=8)
+        url = f"/api/v1/movies/{film.pk}/"
+        expected = self.client.get(url).content
+        caches[settings.MOVIES_API_CACHE].clear()
+
+        with override_settings(MOVIES_API_RENDERING="sql"):
+            self.assertEqual(self.client.get(url).content, expected)
+        self.assertIn("Тест Türk".encode(), expected)
+
+    @override_settings(MOVIES_API_USE_DOCUMENTS=True)
+    def test_same_documents_from_table(self):
+        refresh_documents()
+        expected = self.client.get("/api/v1/movies/?page=2").content
+        caches[settings.MOVIES_API_CACHE].clear()
+
+        with override_settings(MOVIES_API_RENDERING="sql"):
+            self.assertEqual(self.client.get("/api/v1/movies/?page=2").content, expected)
+
+    def test_documents_cached_per_rendering(self):
+        self.client.get("/api/v1/movies/?page=2")
+
+        with override_settings(MOVIES_API_RENDERING="sql"):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get("/api/v1/movies/?page=2&sort=title")
+        self.assertTrue(any("row_to_json" in q["sql"] for q in queries))
+
+    @override_settings(MOVIES_API_RENDERING="sql")
+    def test_not_found(self):
+        response = self.client.get("/api/v1/movies/00000000-0000-0000-0000-000000000000/")
+        self.assertEqual(response.status_code, 404)
+
+
+class MoviesBatchApiTest(MoviesApiTestCase):
+    url = "/api/v1/movies/batch/"
+
+    def setUp(self):
+        super().setUp()
+        self.films = list(FilmWork.objects.order_by("title")[:3])
+        self.missing = "00000000-0000-0000-0000-000000000000"
+
+    def test_get(self):
+        ids = [str(film.pk) for film in self.films]
+
+        # все фильмы агрегируются одним запросом
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {"ids": ",".join(ids + [self.missing])})
+        data = response.json()
+        self.assertEqual(list(data["results"]), ids)
+        self.assertEqual(data["results"][ids[0]]["title"], "Film 000")
+        self.assertEqual(data["missing"], [self.missing])
+
+        # документы уже закодированы и лежат в кэше
+        with self.assertNumQueries(0):
+            self.client.get(self.url, {"ids": ids[0]})
+
+    def test_post(self):
+        response = self.client.post(
+            self.url, {"ids": [str(self.films[1].pk)]}, content_type="application/json"
+        )
+        self.assertEqual(response.json()["results"][str(self.films[1].pk)]["title"], "Film 001")
+
+    @override_settings(MOVIES_API_BATCH_MAX_IDS=2)
+    def test_invalid(self):
+        too_many = ",".join(str(film.pk) for film in self.films)
+        for params in ({}, {"ids": "42"}, {"ids": too_many}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+
+        response = self.client.post(self.url, {"ids": "42"}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class MoviesExportApiTest(MoviesApiTestCase):
+    url = "/api/v1/movies/export/"
+
+    def export(self, **extra):
+        response = self.client.get(self.url, {"fields": "title,actors"}, **extra)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(response["X-Accel-Buffering"], "no")
+        self.assertEqual(response["Cache-Control"], "no-store")
+        return response, b"".join(response.streaming_content)
+
+    def test_export(self):
+        _, content = self.export()
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), self.films_count)
+        self.assertEqual(list(rows[0]), ["id", "title", "actors"])
+        self.assertEqual(rows[0]["actors"], ["Darrell Geer"])
+
+    def test_gzip(self):
+        response, content = self.export(HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(content), self.export()[1])
+
+
+class MoviesApiConditionalTest(ContentTransactionTestCase):
+    def setUp(self):
+        caches[settings.MOVIES_API_CACHE].clear()
+        self.film = FilmWork.objects.create(title="Crescent Star", type="film")
+
+    def assertNotModified(self, url, response):
+        conditional = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(conditional.status_code, 304)
+        conditional = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(conditional.status_code, 304)
+
+    def test_detail(self):
+        url = f"/api/v1/movies/{self.film.pk}/"
+        response = self.client.get(url)
+        self.assertNotModified(url, response)
+
+        genre = Genre.objects.create(name="Drama")
+        GenreFilmWork.objects.create(film_work=self.film, genre=genre)
+        conditional = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(conditional.status_code, 200)
+        self.assertEqual(conditional.json()["genres"], ["Drama"])
+
+    def test_list(self):
+        url = "/api/v1/movies/"
+        response = self.client.get(url)
+        self.assertNotModified(url, response)
+
+        other_page = self.client.get(url, {"cursor": ""}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(other_page.status_code, 200)
+
+        FilmWork.objects.create(title="Another film", type="film")
+        conditional = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(conditional.status_code, 200)
+
+    def test_list_after_delete(self):
+        url = "/api/v1/movies/"
+        FilmWork.objects.create(title="Another film", type="film")
+        response = self.client.get(url)
+
+        # удаление не меняет max(modified), но попадает в журнал изменений
+        self.film.delete()
+        conditional = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(conditional.status_code, 200)
+        self.assertEqual(conditional.json()["count"], 1)
+
+
+class MoviesChangesApiTest(ContentTransactionTestCase):
+    url = "/api/v1/movies/changes/"
+
+    def changes(self, since=None):
+        response = self.client.get(self.url, {"since": since} if since else {})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [(row["id"], row["deleted"]) for row in data["changes"]], data["next"]
+
+    def test_feed(self):
+        film = FilmWork.objects.create(title="Crescent Star", type="film")
+        other = FilmWork.objects.create(title="Rhodes", type="series")
+        person = Person.objects.create(full_name="Darrell Geer")
+        PersonFilmWork.objects.create(film_work=film, person=person, role="actor")
+
+        changes, cursor = self.changes()
+        self.assertEqual(changes, [(str(other.pk), False), (str(film.pk), False)])
+        self.assertEqual(self.changes(cursor), ([], cursor))
+
+        # фильм изменился через человека
+        person.full_name = "Michael Bond"
+        person.save()
+        changes, cursor = self.changes(cursor)
+        self.assertEqual(changes, [(str(film.pk), False)])
+
+        # после delete() у объекта уже нет pk
+        other_id = str(other.pk)
+        other.delete()
+        self.assertEqual(self.changes(cursor)[0], [(other_id, True)])
+
+    def test_invalid_since(self):
+        self.assertEqual(self.client.get(self.url, {"since": "42"}).status_code, 400)
+
+
+class MoviesSearchApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        drama = Genre.objects.create(name="Drama")
+        hamill = Person.objects.create(full_name="Mark Hamill")
+        star_wars = FilmWork.objects.create(title="Star Wars", type="film")
+        FilmWork.objects.create(title="Crescent", description="A star is born", type="film")
+        FilmWork.objects.create(title="Rhodes", type="film")
+        PersonFilmWork.objects.create(film_work=star_wars, person=hamill, role="actor")
+        GenreFilmWork.objects.create(film_work=star_wars, genre=drama)
+        refresh_documents()
+
+    def setUp(self):
+        caches[settings.MOVIES_API_CACHE].clear()
+
+    def search(self, q):
+        return self.client.get("/api/v1/movies/search/", {"q": q}).json()
+
+    def test_ranked_by_title(self):
+        data = self.search("star")
+        self.assertEqual(data["count"], 2)
+        self.assertEqual([row["title"] for row in data["results"]], ["Star Wars", "Crescent"])
+
+    def test_persons_and_genres(self):
+        self.assertEqual([row["title"] for row in self.search("hamill")["results"]], ["Star Wars"])
+        self.assertEqual([row["title"] for row in self.search("drama")["results"]], ["Star Wars"])
+
+    def test_query_required(self):
+        response = self.client.get("/api/v1/movies/search/")
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_query(self):
+        for q in ("star\x00wars", "star " * 100):
+            response = self.client.get("/api/v1/movies/search/", {"q": q})
+            self.assertEqual(response.status_code, 400)
+
+    def test_cursor_rejected(self):
+        response = self.client.get("/api/v1/movies/search/", {"q": "star", "cursor": ""})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cache_separate_from_list(self):
+        listed = self.client.get("/api/v1/movies/", {"q": "star"}).json()
+        self.assertEqual(listed["count"], 3)
+
+        # те же параметры, но другой путь: ответ списка из кэша не подходит
+        self.assertEqual(self.search("star")["count"], 2)
+        response = self.client.get("/api/v1/movies/", {"q": "star"})
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.json(), listed)
+
+
+class MoviesApiFilterTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        drama = Genre.objects.create(name="Drama")
+        short = Genre.objects.create(name="Short")
+        geer = Person.objects.create(full_name="Darrell Geer")
+        cls.crescent = FilmWork.objects.create(title="Crescent Star", type="film", rating=7.9)
+        cls.rhodes = FilmWork.objects.create(title="Rhodes", type="series", rating=5.1)
+        FilmWork.objects.create(title="Untitled", type="film")
+        GenreFilmWork.objects.create(film_work=cls.crescent, genre=drama)
+        GenreFilmWork.objects.create(film_work=cls.rhodes, genre=short)
+        PersonFilmWork.objects.create(film_work=cls.crescent, person=geer, role="actor")
+        PersonFilmWork.objects.create(film_work=cls.rhodes, person=geer, role="director")
+
+    def setUp(self):
+        caches[settings.MOVIES_API_CACHE].clear()
+
+    def titles(self, **params):
+        response = self.client.get("/api/v1/movies/", params)
+        self.assertEqual(response.status_code, 200)
+        return [row["title"] for row in response.json()["results"]]
+
+    def test_filters(self):
+        self.assertEqual(self.titles(genre="Drama"), ["Crescent Star"])
+        self.assertEqual(self.titles(genre=str(self.rhodes.genres.get().pk)), ["Rhodes"])
+        self.assertEqual(self.titles(type="series"), ["Rhodes"])
+        self.assertEqual(self.titles(rating_gte=6), ["Crescent Star"])
+        self.assertEqual(self.titles(person="Darrell Geer"), ["Crescent Star", "Rhodes"])
+        self.assertEqual(self.titles(person="Darrell Geer", role="director"), ["Rhodes"])
+
+    def test_sort(self):
+        self.assertEqual(self.titles(sort="-rating"), ["Crescent Star", "Rhodes", "Untitled"])
+        self.assertEqual(self.titles(sort="rating"), ["Rhodes", "Crescent Star", "Untitled"])
+        self.assertEqual(self.titles(sort="-title"), ["Untitled", "Rhodes", "Crescent Star"])
+
+    def test_sort_not_null_by_index(self):
+        # у NOT NULL полей порядок без NULLS LAST, и id идёт в ту же сторону:
+        # так PostgreSQL читает индекс (field, id) с конца без сортировки
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/api/v1/movies/", {"sort": "-modified"})
+        sql = next(q["sql"] for q in queries if "ORDER BY" in q["sql"])
+        self.assertIn('"modified" DESC, "content"."film_work"."id" DESC', sql)
+        self.assertNotIn("NULLS LAST", sql)
+
+    def test_invalid_params(self):
+        for params in (
+            {"type": "cartoon"},
+            {"rating_gte": "high"},
+            {"role": "actor"},
+            {"person": "Darrell Geer", "role": "stuntman"},
+            {"sort": "description"},
+            {"genre": "Drama\x00"},
+            {"person": "Darrell\x00Geer"},
+        ):
+            response = self.client.get("/api/v1/movies/", params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_filter_applied_before_aggregation(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/api/v1/movies/", {"genre": "Drama", "person": "Darrell Geer"})
+
+        ids_query, aggregation_query = [
+            q["sql"] for q in queries if "EXISTS" in q["sql"] or is_aggregation(q["sql"])
+        ][-2:]
+        # фильтры отбирают id без группировки, а агрегация идёт только по найденным id
+        self.assertIn("EXISTS", ids_query)
+        self.assertNotIn("GROUP BY", ids_query)
+        self.assertTrue(is_aggregation(aggregation_query))
+        self.assertNotIn("EXISTS", aggregation_query)
+        self.assertIn(str(self.crescent.pk).replace("-", ""), aggregation_query.replace("-", ""))
+
+
+class MoviesApiFieldsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.crescent = FilmWork.objects.create(title="Crescent Star", type="film", rating=7.9)
+        GenreFilmWork.objects.create(film_work=cls.crescent, genre=Genre.objects.create(name="Drama"))
+
+    def setUp(self):
+        caches[settings.MOVIES_API_CACHE].clear()
+
+    def test_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/v1/movies/", {"fields": "title,rating"})
+
+        row = response.json()["results"][0]
+        self.assertEqual(list(row), ["id", "title", "rating"])
+        # без списков не нужны ни соединения, ни группировка
+        self.assertFalse(any(is_aggregation(q["sql"]) for q in queries))
+
+    def test_fields_join_only_requested(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/v1/movies/", {"fields": "genres"})
+
+        self.assertEqual(response.json()["results"][0]["genres"], ["Drama"])
+        aggregation_query = [q["sql"] for q in queries if is_aggregation(q["sql"])][-1]
+        self.assertNotIn("person_film_work", aggregation_query)
+
+    def test_exclude(self):
+        url = f"/api/v1/movies/{self.crescent.pk}/"
+        response = self.client.get(url, {"exclude": "description,actors"})
+        self.assertEqual(
+            list(response.json()),
+            ["id", "title", "creation_date", "rating", "type", "directors", "writers", "genres"],
+        )
+
+    def test_invalid_fields(self):
+        for params in ({"fields": "budget"}, {"fields": "title", "exclude": "rating"}):
+            response = self.client.get("/api/v1/movies/", params)
+            self.assertEqual(response.status_code, 400, params)
+            response = self.client.get(f"/api/v1/movies/{self.crescent.pk}/", params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+class AdminChangeListTest(MoviesApiTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(user)
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {connection.ops.quote_name(FilmWork._meta.db_table)}")
+
+    def test_estimated_count(self):
+        with mock.patch.object(EstimatedCountPaginator, "estimate_threshold", 1):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get("/admin/movies/filmwork/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any("COUNT(" in q["sql"] for q in queries))
+        self.assertEqual(response.context["cl"].result_count, self.films_count)
+
+    def test_exact_count_for_small_tables(self):
+        response = self.client.get("/admin/movies/filmwork/")
+        self.assertEqual(response.context["cl"].result_count, self.films_count)
+
+    def test_inline_does_not_load_all_persons(self):
+        film = FilmWork.objects.first()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/admin/movies/filmwork/{film.pk}/change/")
+
+        self.assertEqual(response.status_code, 200)
+        person_queries = [q["sql"] for q in queries if 'FROM "content"."person"' in q["sql"]]
+        self.assertTrue(person_queries)
+        for sql in person_queries:
+            self.assertIn("WHERE", sql)
+
+    def search(self, url, term) -> list:
+        response = self.client.get(url, {"q": term})
+        self.assertEqual(response.status_code, 200)
+        return sorted(str(film) for film in response.context["cl"].result_list)
+
+    @override_settings(MOVIES_API_USE_DOCUMENTS=True)
+    def test_search_documents(self):
+        refresh_documents()
+        # полнотекстовый поиск находит фильмы по людям, а не только по названию
+        self.assertEqual(len(self.search("/admin/movies/filmwork/", "Geer")), self.films_count)
+
+    @override_settings(MOVIES_API_USE_DOCUMENTS=True)
+    def test_search_without_documents(self):
+        self.assertEqual(self.search("/admin/movies/filmwork/", "m 00"), [
+            f"Film {i:03}" for i in range(10)
+        ])
+
+    def test_search_description_by_default(self):
+        FilmWork.objects.filter(title="Film 007").update(description="A lonely lighthouse keeper")
+        self.assertEqual(self.search("/admin/movies/filmwork/", "lighthouse"), ["Film 007"])
+
+    @override_settings(MOVIES_API_USE_DOCUMENTS=True)
+    def test_autocomplete_by_prefix(self):
+        refresh_documents()
+        response = self.client.get("/admin/movies/filmwork/autocomplete/", {"term": "Film 05"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(result["text"] for result in response.json()["results"]),
+            ["Film 005"] + [f"Film {i:03}" for i in range(50, 60)],
+        )
+
+
+class MetricsTest(MoviesApiTestCase):
+    def test_server_timing(self):
+        response = self.client.get("/api/v1/movies/")
+        timing = dict(part.split(";", 1) for part in response["Server-Timing"].split(", "))
+        self.assertEqual(set(timing), {"db", "serialize", "total"})
+        # ETag/Last-Modified, COUNT, id страницы и агрегация
+        self.assertIn('desc="4 queries"', timing["db"])
+
+    def test_metrics(self):
+        self.client.get("/api/v1/movies/")
+        self.client.get("/api/v1/movies/")
+
+        content = self.client.get("/metrics").content.decode()
+        self.assertIn('view="api/v1/movies/",method="GET",le="+Inf"} ', content)
+        self.assertIn("http_request_db_queries_bucket", content)
+        self.assertIn("movies_api_cache_hits_total", content)
+
+    def test_metrics_from_all_workers(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # метрики ещё одного работающего воркера и уже завершившегося
+        other = {
+            "histograms": {"duration": [[["api/v1/movies/", "GET"], [1] + [0] * 11, 0.001]]},
+            "cache": {"hits": 5, "misses": 1},
+        }
+        for pid in ("1", "999999"):
+            with open(f"{directory.name}/{pid}.json", "w") as f:
+                json.dump(other, f)
+        count = 'http_request_duration_seconds_count{view="api/v1/movies/",method="GET"}'
+
+        registry = Registry()
+        with override_settings(METRICS_DIR=directory.name), \
+                mock.patch("movies.metrics.registry", registry), \
+                mock.patch("movies.metrics._is_alive", lambda pid: pid != 999999), \
+                mock.patch.object(response_cache, "stats", lambda: {"hits": 0, "misses": 0}):
+            self.client.get("/api/v1/movies/")
+            content = self.client.get("/metrics").content.decode()
+            # архив завершившегося воркера не учитывается повторно
+            self.assertIn(f"{count} 3\n", self.client.get("/metrics").content.decode())
+
+        self.assertIn(f"{count} 3\n", content)
+        self.assertIn("movies_api_cache_hits_total 10\n", content)
+        self.assertFalse(os.path.exists(f"{directory.name}/999999.json"))
+        self.assertTrue(os.path.exists(f"{directory.name}/archive.json"))
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+
+
+class ProfilingTest(MoviesApiTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings_override = override_settings(PROFILING_DIR=directory.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.staff = User.objects.create_superuser("admin", "admin@example.com", "password")
+
+    def test_not_profiled_by_default(self):
+        self.assertNotIn("X-Profile-Id", self.client.get("/api/v1/movies/?_profile=1"))
+
+    def test_staff_profile(self):
+        self.client.force_login(self.staff)
+        response = self.client.get("/api/v1/movies/?_profile=1")
+        profile_id = response["X-Profile-Id"]
+
+        meta = self.client.get(f"/profiles/{profile_id}.json")
+        queries = json.loads(b"".join(meta.streaming_content))["queries"]
+        self.assertTrue(any("ARRAY" in query["sql"] for query in queries))
+        profiles = self.client.get("/profiles/").json()["profiles"]
+        self.assertIn(f"/profiles/{profile_id}.pstats", profiles)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(f"/profiles/{profile_id}.json").status_code, 302)
+
+    def profile_queries(self, url) -> list:
+        response = self.client.get(url, {"_profile": "1"})
+        meta = self.client.get(f"/profiles/{response['X-Profile-Id']}.json")
+        return json.loads(b"".join(meta.streaming_content))["queries"]
+
+    def test_params_not_logged_by_default(self):
+        self.client.force_login(self.staff)
+        queries = self.profile_queries("/api/v1/movies/")
+        self.assertTrue(queries)
+        self.assertTrue(all(query["params"] is None for query in queries))
+
+    @override_settings(PROFILING_LOG_PARAMS=True)
+    def test_session_params_never_logged(self):
+        log = QueryLog()
+        log(lambda *args: None, 'SELECT * FROM "django_session" WHERE "session_key" = %s',
+            ["secret"], False, {})
+        log(lambda *args: None, 'SELECT * FROM "content"."film_work" WHERE "id" = %s',
+            ["42"], False, {})
+
+        self.assertEqual([query["params"] for query in log.queries], [None, "['42']"])
+
+    def test_streaming_not_profiled(self):
+        self.client.force_login(self.staff)
+        response = self.client.get("/api/v1/movies/export/", {"_profile": "1"})
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(self.client.get("/profiles/").json()["profiles"], [])
+
+    @override_settings(PROFILING_MODE="sampler", PROFILING_SAMPLE_INTERVAL=0.001)
+    def test_signed_header(self):
+        response = self.client.get("/api/v1/movies/", HTTP_X_PROFILE="forged")
+        self.assertNotIn("X-Profile-Id", response)
+
+        response = self.client.get("/api/v1/movies/", HTTP_X_PROFILE=make_profile_token())
+        self.client.force_login(self.staff)
+        url = f"/profiles/{response['X-Profile-Id']}.collapsed"
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get("/profiles/..%2Fsettings.py").status_code, 404)
+
+
+class GenerateCatalogueTest(TestCase):
+    def test_deterministic(self):
+        counts = generate_catalogue(films=50, persons=100, genres=10, seed=1)
+        self.assertEqual(FilmWork.objects.count(), 50)
+        self.assertEqual(PersonFilmWork.objects.count(), counts["person_film_work"])
+        self.assertEqual(GenreFilmWork.objects.count(), counts["genre_film_work"])
+        first = list(FilmWork.objects.order_by("id").values_list("id", "title"))
+        for role in ("director", "writer"):
+            films = PersonFilmWork.objects.filter(role=role).values("film_work").distinct()
+            self.assertEqual(films.count(), 50, role)
+
+        FilmWork.objects.all().delete()
+        Person.objects.all().delete()
+        Genre.objects.all().delete()
+        self.assertEqual(generate_catalogue(films=50, persons=100, genres=10, seed=1), counts)
+        self.assertEqual(list(FilmWork.objects.order_by("id").values_list("id", "title")), first)
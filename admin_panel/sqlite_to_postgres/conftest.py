@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# load_data.py запускается из своей папки и импортирует utils как пакет верхнего уровня
+sys.path.insert(0, str(Path(__file__).parent))
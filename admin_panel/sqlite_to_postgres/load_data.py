@@ -1,23 +1,81 @@
+import argparse
 import yaml
 import psycopg2
 import sqlite3
+from contextlib import nullcontext
 from pathlib import Path
+from typing import Optional
 from psycopg2.extensions import connection as _connection
 
 from utils.sqliteloader import SQLiteLoader
-from utils.postgressaver import PostgresSaver
+from utils.parallelwriter import ParallelWriter, TRANSACTION_MODES
+from utils.postgressaver import PostgresSaver, WRITE_METHODS
 
 
-def load_from_sqlite(connection: sqlite3.Connection, pg_conn: _connection):
+def load_from_sqlite(
+    connection: sqlite3.Connection,
+    pg_conn: _connection,
+    method: str = "copy",
+    page_size: int = 1000,
+    chunk_size: int = 1000,
+    preload: bool = False,
+    incremental: bool = False,
+    writer: Optional[ParallelWriter] = None
+):
     """Основной метод загрузки данных из SQLite в Postgres"""
-    postgres_saver = PostgresSaver(pg_conn)
+    postgres_saver = PostgresSaver(
+        pg_conn,
+        method=method,
+        page_size=page_size,
+        chunk_size=chunk_size,
+        incremental=incremental,
+        writer=writer
+    )
     sqlite_loader = SQLiteLoader(connection)
+    if preload:
+        postgres_saver.preload()
 
-    data = sqlite_loader.load_movies()
+    data = sqlite_loader.load_movies(chunk_size)
     postgres_saver.save_all_data(data)
 
 
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Перенос фильмов из SQLite в PostgreSQL")
+    parser.add_argument(
+        "--method", choices=WRITE_METHODS, default="copy",
+        help="способ записи в PostgreSQL (по умолчанию copy)"
+    )
+    parser.add_argument(
+        "--page-size", type=int, default=1000,
+        help="размер пачки строк для методов values и batch"
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=1000,
+        help="сколько фильмов читать из SQLite и записывать в PostgreSQL за раз"
+    )
+    parser.add_argument(
+        "--preload", action="store_true",
+        help="не добавлять повторно людей и жанры, которые уже есть в PostgreSQL"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="переносить только новые и изменившиеся с прошлого запуска фильмы"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="сколько таблиц записывать параллельно (по умолчанию 1 — последовательная запись)"
+    )
+    parser.add_argument(
+        "--transaction", choices=TRANSACTION_MODES, default="table",
+        help="при параллельной записи: фиксировать каждую таблицу (table) "
+             "или всю группу независимых таблиц (phase)"
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
+
     parent_dir = Path(__file__).parent
     path_dsn = parent_dir.joinpath("dsl.yaml")
 
@@ -25,5 +83,17 @@ if __name__ == "__main__":
         data = f.read()
         dsl = yaml.safe_load(data)
     sqlite_path = Path(__file__).parent.joinpath("db.sqlite")
-    with sqlite3.connect(sqlite_path) as sqlite_conn, psycopg2.connect(**dsl) as pg_conn:
-        load_from_sqlite(sqlite_conn, pg_conn)
+    writer = ParallelWriter(dsl, args.workers, args.transaction) if args.workers > 1 else None
+    with writer or nullcontext(), \
+            sqlite3.connect(sqlite_path) as sqlite_conn, \
+            psycopg2.connect(**dsl) as pg_conn:
+        load_from_sqlite(
+            sqlite_conn,
+            pg_conn,
+            args.method,
+            args.page_size,
+            args.chunk_size,
+            args.preload,
+            args.incremental,
+            writer
+        )
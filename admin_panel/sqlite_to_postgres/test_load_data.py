@@ -0,0 +1,183 @@
+import os
+import sqlite3
+from contextlib import nullcontext
+from pathlib import Path
+
+import psycopg2
+import pytest
+import yaml
+
+from load_data import load_from_sqlite
+from schema_design.schema import SQL_SCHEMA
+from utils.parallelwriter import ParallelWriter, TRANSACTION_MODES
+from utils.postgressaver import WRITE_METHODS
+
+PARENT_DIR = Path(__file__).parent
+SQLITE_PATH = PARENT_DIR.joinpath("db.sqlite")
+TABLES = ("film_work", "genre", "person", "genre_film_work", "person_film_work")
+
+
+@pytest.fixture(scope="session")
+def dsl():
+    """Параметры подключения к отдельной тестовой базе test_<dbname>. Хост и порт берутся
+    из dsl.yaml, их можно переопределить переменными окружения DB_HOST и DB_PORT.
+    """
+    with PARENT_DIR.joinpath("dsl.yaml").open("r") as f:
+        dsl = yaml.safe_load(f.read())
+    dsl["host"] = os.environ.get("DB_HOST", dsl["host"])
+    dsl["port"] = os.environ.get("DB_PORT", dsl["port"])
+
+    try:
+        # тестовая база создаётся из служебной базы postgres, как это делает Django
+        admin_conn = psycopg2.connect(**{**dsl, "dbname": "postgres"})
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL недоступен: {e}")
+
+    test_dsl = {**dsl, "dbname": f"test_{dsl['dbname']}"}
+    admin_conn.autocommit = True
+    with admin_conn.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS {test_dsl['dbname']}")
+        cursor.execute(f"CREATE DATABASE {test_dsl['dbname']}")
+
+    conn = psycopg2.connect(**test_dsl)
+    with conn, conn.cursor() as cursor:
+        cursor.execute(SQL_SCHEMA)
+    conn.close()
+
+    yield test_dsl
+
+    with admin_conn.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE {test_dsl['dbname']}")
+    admin_conn.close()
+
+
+def clear(pg_conn):
+    with pg_conn.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {', '.join(f'content.{table}' for table in TABLES)}")
+        cursor.execute("DROP TABLE IF EXISTS content.sqlite_sync_state")
+    pg_conn.commit()
+
+
+@pytest.fixture
+def pg_conn(dsl):
+    conn = psycopg2.connect(**dsl)
+    clear(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def sqlite_conn():
+    conn = sqlite3.connect(SQLITE_PATH)
+    yield conn
+    conn.close()
+
+
+def load(sqlite_conn, pg_conn, dsl=None, workers=1, transaction="table", **kwargs):
+    """Загрузка так же, как из load_data.py: при workers > 1 — через ParallelWriter."""
+    writer = ParallelWriter(dsl, workers, transaction) if workers > 1 else None
+    with writer or nullcontext():
+        load_from_sqlite(sqlite_conn, pg_conn, writer=writer, **kwargs)
+
+
+def table_counts(pg_conn) -> dict:
+    counts = {}
+    with pg_conn.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(f"SELECT count(*) FROM content.{table}")
+            counts[table] = cursor.fetchone()[0]
+    pg_conn.rollback()
+
+    return counts
+
+
+def table_state(pg_conn) -> dict:
+    """Количество строк и отпечаток содержимого каждой таблицы, включая modified."""
+    state = {}
+    with pg_conn.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(f"""
+            SELECT count(*), md5(string_agg(t::text, ',' ORDER BY t.id))
+            FROM content.{table} t
+            """)
+            state[table] = cursor.fetchone()
+    pg_conn.rollback()
+
+    return state
+
+
+@pytest.fixture(scope="session")
+def reference_counts(dsl) -> dict:
+    """Эталон: последовательная загрузка методом copy одной пачкой."""
+    conn = psycopg2.connect(**dsl)
+    sqlite = sqlite3.connect(SQLITE_PATH)
+    try:
+        # до загрузки: SQLiteLoader заменяет row_factory соединения
+        movies = sqlite.execute("SELECT count(*) FROM movies").fetchone()[0]
+        clear(conn)
+        load(sqlite, conn, method="copy", chunk_size=10000)
+        counts = table_counts(conn)
+    finally:
+        sqlite.close()
+        conn.close()
+
+    assert counts["film_work"] == movies
+    assert all(counts.values())
+
+    return counts
+
+
+@pytest.mark.parametrize("chunk_size", [1000, 100])
+@pytest.mark.parametrize("method", WRITE_METHODS)
+def test_methods_load_same_rows(sqlite_conn, pg_conn, reference_counts, method, chunk_size):
+    load(sqlite_conn, pg_conn, method=method, page_size=50, chunk_size=chunk_size)
+
+    assert table_counts(pg_conn) == reference_counts
+
+
+@pytest.mark.parametrize("transaction", TRANSACTION_MODES)
+def test_parallel_workers(sqlite_conn, pg_conn, dsl, reference_counts, transaction):
+    load(sqlite_conn, pg_conn, dsl, workers=3, transaction=transaction, chunk_size=200)
+
+    assert table_counts(pg_conn) == reference_counts
+
+
+def test_preload_does_not_duplicate(sqlite_conn, pg_conn, reference_counts):
+    load(sqlite_conn, pg_conn, chunk_size=300)
+    load(sqlite_conn, pg_conn, chunk_size=300, preload=True)
+
+    assert table_counts(pg_conn) == reference_counts
+
+
+@pytest.mark.parametrize("method", WRITE_METHODS)
+def test_rerun_is_noop(sqlite_conn, pg_conn, reference_counts, method):
+    load(sqlite_conn, pg_conn, method=method)
+    state = table_state(pg_conn)
+
+    # повторная полная загрузка не добавляет и не меняет строки, даже modified
+    load(sqlite_conn, pg_conn, method=method)
+
+    assert table_state(pg_conn) == state
+    assert table_counts(pg_conn) == reference_counts
+
+
+def test_incremental_rerun_is_noop(sqlite_conn, pg_conn, dsl, reference_counts):
+    load(sqlite_conn, pg_conn, incremental=True)
+    state = table_state(pg_conn)
+
+    load(sqlite_conn, pg_conn, dsl, workers=2, incremental=True)
+
+    assert table_state(pg_conn) == state
+    assert table_counts(pg_conn) == reference_counts
+    with pg_conn.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM content.sqlite_sync_state")
+        assert cursor.fetchone()[0] == reference_counts["film_work"]
+
+
+def test_writer_closed_on_failure(sqlite_conn, pg_conn, dsl):
+    writer = ParallelWriter(dsl, 2)
+    with pytest.raises(ValueError):
+        with writer:
+            load_from_sqlite(sqlite_conn, pg_conn, method="bogus", writer=writer)
+
+    assert writer.pool.closed
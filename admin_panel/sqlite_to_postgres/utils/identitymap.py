@@ -0,0 +1,76 @@
+from psycopg2.extensions import connection as _connection
+from uuid import uuid4
+
+from typing import Callable, Dict, Optional, Tuple
+
+
+class IdentityMap():
+    """Соответствие имени и id для дедупликации людей и жанров. Поиск по имени работает
+    за O(1), имена сравниваются после нормализации (лишние пробелы и регистр не учитываются).
+
+    Один и тот же объект можно переиспользовать между запусками, а перед загрузкой
+    заполнить строками, которые уже есть в PostgreSQL (см. load).
+
+    Parameters
+    ----------
+    id_factory : Callable[[str], str], optional
+        Функция, которая создаёт id по нормализованному имени. По умолчанию uuid4
+    """
+
+    def __init__(self, id_factory: Optional[Callable[[str], str]] = None):
+        self._ids: Dict[str, str] = {}
+        self.id_factory = id_factory
+
+    @staticmethod
+    def normalize(name: str) -> str:
+        """Приводит имя к виду, в котором сравниваются дубли.
+        """
+        return " ".join(name.split()).casefold()
+
+    def __contains__(self, name: str) -> bool:
+        return self.normalize(name) in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def get(self, name: str) -> Optional[str]:
+        """Возвращает id по имени или None, если имя ещё не встречалось.
+        """
+        return self._ids.get(self.normalize(name))
+
+    def add(self, name: str, id_: str):
+        """Запоминает id для имени. Уже известное имя не перезаписывается.
+        """
+        self._ids.setdefault(self.normalize(name), id_)
+
+    def get_or_create(self, name: str) -> Tuple[str, bool]:
+        """Возвращает id по имени и признак того, что id был создан только что.
+        """
+        key = self.normalize(name)
+        if key in self._ids:
+            return self._ids[key], False
+
+        id_ = str(uuid4()) if self.id_factory is None else self.id_factory(key)
+        self._ids[key] = id_
+        return id_, True
+
+    def load(self, connection: _connection, table: str, column: str, itersize: int = 10000):
+        """Заполняет соответствие строками из таблицы PostgreSQL. Таблица читается
+        серверным курсором, чтобы не держать в памяти весь результат запроса.
+
+        Parameters
+        ----------
+        connection : psycopg2.extensions.connection
+            Объект соединения с PostgreSQL
+        table : str
+            Таблица вместе со схемой, например content.person
+        column : str
+            Колонка с именем
+        itersize : int
+            Сколько строк забирать с сервера за раз
+        """
+        with connection.cursor(name=f"identity_map_{column}") as cursor:
+            cursor.itersize = itersize
+            cursor.execute(f"SELECT id, {column} FROM {table}")
+            for id_, name in cursor:
+                self.add(name, str(id_))
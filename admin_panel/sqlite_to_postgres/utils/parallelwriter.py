@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extensions import connection as _connection
+from psycopg2.pool import ThreadedConnectionPool
+
+from typing import Callable, List
+
+# стратегии фиксации транзакций
+TRANSACTION_MODES = ("table", "phase")
+
+Task = Callable[[_connection], None]
+
+
+class ParallelWriter():
+    """Выполняет запись независимых таблиц параллельно через пул соединений с PostgreSQL.
+
+    Используется как контекстный менеджер, который закрывает потоки и соединения.
+
+    Запись разбивается на фазы: задачи одной фазы выполняются одновременно, следующая фаза
+    начинается только после того, как предыдущая зафиксирована. Так таблицы связей
+    записываются уже после их родительских таблиц.
+
+    Parameters
+    ----------
+    dsl : dict
+        Параметры подключения к PostgreSQL
+    workers : int
+        Количество соединений и потоков
+    transaction : str
+        table — каждая таблица фиксируется в своей транзакции сразу после записи,
+        phase — фаза фиксируется целиком, только если все её задачи выполнены успешно
+    """
+
+    def __init__(self, dsl: dict, workers: int = 2, transaction: str = "table"):
+        if transaction not in TRANSACTION_MODES:
+            raise ValueError(
+                f"transaction должен быть одним из: {', '.join(TRANSACTION_MODES)}"
+            )
+
+        self.workers = workers
+        self.transaction = transaction
+        self.pool = ThreadedConnectionPool(workers, workers, **dsl)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def _run_group(self, conn: _connection, tasks: List[Task]):
+        """Последовательно выполняет задачи на одном соединении.
+        """
+        for task in tasks:
+            task(conn)
+            if self.transaction == "table":
+                conn.commit()
+
+    def run_phase(self, tasks: List[Task]):
+        """Выполняет задачи фазы параллельно. Задачи распределяются по соединениям
+        поровну, каждое соединение используется только одним потоком.
+        """
+        groups = [tasks[i::self.workers] for i in range(self.workers)]
+        groups = [group for group in groups if group]
+        conns = [self.pool.getconn() for _ in groups]
+        try:
+            futures = [
+                self.executor.submit(self._run_group, conn, group)
+                for conn, group in zip(conns, groups)
+            ]
+            errors = [future.exception() for future in futures]
+            errors = [error for error in errors if error is not None]
+            if errors:
+                for conn in conns:
+                    conn.rollback()
+                raise errors[0]
+
+            for conn in conns:
+                conn.commit()
+        finally:
+            for conn in conns:
+                self.pool.putconn(conn)
+
+    def run(self, phases: List[List[Task]]):
+        """Выполняет фазы одну за другой.
+        """
+        for tasks in phases:
+            self.run_phase(tasks)
+
+    def close(self):
+        self.executor.shutdown()
+        self.pool.closeall()
+
+    def __enter__(self) -> "ParallelWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        # потоки и соединения освобождаются и тогда, когда загрузка упала
+        self.close()
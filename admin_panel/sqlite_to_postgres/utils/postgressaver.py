@@ -1,18 +1,120 @@
-from psycopg2.extensions import connection as _connection
-from uuid import uuid4
+from psycopg2.extensions import connection as _connection, cursor as _cursor
+from psycopg2.extras import execute_batch, execute_values
+from tempfile import SpooledTemporaryFile
+from uuid import NAMESPACE_URL, uuid5
 from datetime import datetime
 
-from typing import List, Dict, Set
+from itertools import islice
+from typing import Dict, Iterable, List, Optional
 from typing import Any
 
+from utils.identitymap import IdentityMap
+from utils.parallelwriter import ParallelWriter
+from utils.syncstate import SyncState
+
+# методы записи данных в PostgreSQL
+WRITE_METHODS = ("copy", "values", "batch")
+
+# сколько байт буфера COPY держать в памяти, прежде чем сбросить его во временный файл
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
+
+# пространство имён для детерминированных id: повторная загрузка тех же данных
+# даёт те же id, поэтому запись можно выполнять как upsert
+ID_NAMESPACE = uuid5(NAMESPACE_URL, "movies/sqlite_to_postgres")
+
+# экранирование спецсимволов для текстового формата COPY, обратный слэш должен быть первым
+COPY_ESCAPES = (("\\", "\\\\"), ("\t", "\\t"), ("\n", "\\n"), ("\r", "\\r"))
+
+
+def make_id(table: str, *parts: str) -> str:
+    """Детерминированный uuid строки таблицы по её естественному ключу.
+    """
+    return str(uuid5(ID_NAMESPACE, ":".join((table, *parts))))
+
 
 class PostgresSaver():
-    def __init__(self, connection: _connection):
+    """Преобразует данные из SQLiteLoader в таблицы схемы content и записывает их в PostgreSQL.
+
+    Parameters
+    ----------
+    connection : psycopg2.extensions.connection
+        Объект соединения с PostgreSQL
+    method : str
+        Метод записи: copy, values или batch
+    page_size : int
+        Размер пачки строк для методов values и batch
+    chunk_size : int
+        Сколько фильмов накапливать в локальных таблицах перед записью в PostgreSQL
+    persons : IdentityMap, optional
+        Уже известные люди, например оставшиеся от предыдущего запуска
+    genres : IdentityMap, optional
+        Уже известные жанры
+    incremental : bool
+        Переносить только новые и изменившиеся с прошлого запуска фильмы
+    writer : ParallelWriter, optional
+        Пул соединений для параллельной записи таблиц. По умолчанию таблицы
+        записываются последовательно через основное соединение
+    """
+
+    # колонки таблиц в том порядке, в котором они записываются в PostgreSQL
+    COLUMNS = {
+        "film_work": (
+            "id", "title", "description", "creation_date", "certificate",
+            "file_path", "rating", "type", "created", "modified"
+        ),
+        "genre": ("id", "name", "description", "created", "modified"),
+        "person": ("id", "full_name", "birth_date", "created", "modified"),
+        "genre_film_work": ("id", "film_work_id", "genre_id", "created"),
+        "person_film_work": ("id", "film_work_id", "person_id", "role", "created"),
+    }
+
+    # как поступать со строками, которые уже есть в PostgreSQL. Фильм обновляется,
+    # только если изменились его данные, чтобы не трогать modified без причины
+    ON_CONFLICT = {
+        "film_work": """
+            ON CONFLICT (id) DO UPDATE SET
+                title = EXCLUDED.title,
+                description = EXCLUDED.description,
+                rating = EXCLUDED.rating,
+                type = EXCLUDED.type,
+                modified = EXCLUDED.modified
+            WHERE (film_work.title, film_work.description, film_work.rating, film_work.type)
+                IS DISTINCT FROM
+                (EXCLUDED.title, EXCLUDED.description, EXCLUDED.rating, EXCLUDED.type)
+        """,
+        "genre": "ON CONFLICT (id) DO NOTHING",
+        "person": "ON CONFLICT (id) DO NOTHING",
+        "genre_film_work": "ON CONFLICT (film_work_id, genre_id) DO NOTHING",
+        "person_film_work": "ON CONFLICT (film_work_id, person_id, role) DO NOTHING",
+    }
+
+    def __init__(
+        self,
+        connection: _connection,
+        method: str = "copy",
+        page_size: int = 1000,
+        chunk_size: int = 1000,
+        persons: Optional[IdentityMap] = None,
+        genres: Optional[IdentityMap] = None,
+        incremental: bool = False,
+        writer: Optional[ParallelWriter] = None
+    ):
+        if method not in WRITE_METHODS:
+            raise ValueError(f"method должен быть одним из: {', '.join(WRITE_METHODS)}")
+
         self.conn = connection
+        self.method = method
+        self.page_size = page_size
+        self.chunk_size = chunk_size
+
+        # id уже встреченных людей и жанров, чтобы избежать дублирования данных.
+        # Локальные таблицы очищаются после каждой пачки, поэтому id хранятся отдельно
+        self.persons = IdentityMap(self._person_id) if persons is None else persons
+        self.genres = IdentityMap(self._genre_id) if genres is None else genres
 
-        # сеты, чтобы избежать дублирования данных
-        self.person_set: Set[str] = set()
-        self.genres_set: Set[str] = set()
+        # контрольные суммы перенесённых фильмов для инкрементальной загрузки
+        self.sync_state = SyncState(connection) if incremental else None
+        self.writer = writer
 
         # списки, в которых хранятся таблицы для PostgreSQL
         self.film_work: List[dict] = []
@@ -24,10 +126,18 @@ class PostgresSaver():
         # название схемы в PostgreSQL
         self.schema = "content"
 
+    @staticmethod
+    def _person_id(name: str) -> str:
+        return make_id("person", name)
+
+    @staticmethod
+    def _genre_id(name: str) -> str:
+        return make_id("genre", name)
+
     def append_film_work(self, row: Dict[str, Any]) -> str:
         """Добавляет одну строку в локальную таблицу film_work и возвращает uuid фильма.
         """
-        film_id = str(uuid4())
+        film_id = make_id("film_work", row["id"])
         new_row = {
             "id": film_id,
             "title": row["title"],
@@ -65,15 +175,9 @@ class PostgresSaver():
 
         id_list = []
         for person in person_list:
-            if person not in self.person_set:
-                id_ = str(uuid4())
+            id_, created = self.persons.get_or_create(person)
+            if created:
                 self._add_person(id_, person)
-                self.person_set.add(person)
-            else:
-                for p in self.person:
-                    if p["full_name"] == person:
-                        id_ = p["id"]
-                        break
 
             id_list.append(id_)
 
@@ -100,15 +204,9 @@ class PostgresSaver():
 
         id_list = []
         for genre in genre_list:
-            if genre not in self.genres_set:
-                id_ = str(uuid4())
+            id_, created = self.genres.get_or_create(genre)
+            if created:
                 self._add_genre(id_, genre)
-                self.genres_set.add(genre)
-            else:
-                for g in self.genre:
-                    if g["name"] == genre:
-                        id_ = g["id"]
-                        break
 
             id_list.append(id_)
 
@@ -117,8 +215,9 @@ class PostgresSaver():
     def append_person_film_work(self, film_id: str, person_id_list: List[str], role: str):
         """Добавляет несколько строк в локальную таблицу person_film_work.
         """
-        for person_id in person_id_list:
-            id_ = str(uuid4())
+        # после нормализации имён один человек может встретиться в списке дважды
+        for person_id in dict.fromkeys(person_id_list):
+            id_ = make_id("person_film_work", film_id, person_id, role)
             row = {
                 "id": id_,
                 "film_work_id": film_id,
@@ -131,8 +230,8 @@ class PostgresSaver():
     def append_genre_film_work(self, film_id: str, genre_id_list: List[str]):
         """Добавляет несколько строк в локальную таблицу genre_film_work.
         """
-        for genre_id in genre_id_list:
-            id_ = str(uuid4())
+        for genre_id in dict.fromkeys(genre_id_list):
+            id_ = make_id("genre_film_work", film_id, genre_id)
             row = {
                 "id": id_,
                 "film_work_id": film_id,
@@ -141,110 +240,204 @@ class PostgresSaver():
             }
             self.genre_film_work.append(row)
 
-    def insert_film_work(self):
+    def insert_film_work(self, conn: Optional[_connection] = None):
         """Вставляет данные из локальной таблицы film_work в PostgreSQL.
         """
-        with self.conn.cursor() as cursor:
-            for row in self.film_work:
-                line = tuple(val for val in row.values())
-                cursor.execute("""INSERT INTO content.film_work (
-                    id,
-                    title,
-                    description,
-                    creation_date,
-                    certificate,
-                    file_path,
-                    rating,
-                    type,
-                    created,
-                    modified
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, line)
-
-    def insert_genre(self):
+        self._write("film_work", self.film_work, self.ON_CONFLICT["film_work"], conn)
+
+    def insert_genre(self, conn: Optional[_connection] = None):
         """Вставляет данные из локальной таблицы genre в PostgreSQL.
         """
-        with self.conn.cursor() as cursor:
-            for row in self.genre:
-                line = tuple(val for val in row.values())
-                cursor.execute("""
-                INSERT INTO content.genre (
-                    id,
-                    name,
-                    description,
-                    created,
-                    modified
-                ) VALUES (%s, %s, %s, %s, %s)
-                """, line)
-
-    def insert_person(self):
+        self._write("genre", self.genre, self.ON_CONFLICT["genre"], conn)
+
+    def insert_person(self, conn: Optional[_connection] = None):
         """Вставляет данные из локальной таблицы person в PostgreSQL.
         """
-        with self.conn.cursor() as cursor:
-            for row in self.person:
-                line = tuple(val for val in row.values())
-                cursor.execute("""
-                INSERT INTO content.person (
-                    id,
-                    full_name,
-                    birth_date,
-                    created,
-                    modified
-                ) VALUES (%s, %s, %s, %s, %s)
-                """, line)
-
-    def insert_genre_film_work(self):
+        self._write("person", self.person, self.ON_CONFLICT["person"], conn)
+
+    def insert_genre_film_work(self, conn: Optional[_connection] = None):
         """Вставляет данные из локальной таблицы genre_film_work в PostgreSQL.
         """
-        with self.conn.cursor() as cursor:
-            for row in self.genre_film_work:
-                line = tuple(val for val in row.values())
-                cursor.execute("""
-                INSERT INTO content.genre_film_work (
-                    id,
-                    film_work_id,
-                    genre_id,
-                    created
-                ) VALUES (%s, %s, %s, %s)
-                """, line)
-
-    def insert_person_film_work(self):
+        self._write(
+            "genre_film_work", self.genre_film_work, self.ON_CONFLICT["genre_film_work"], conn
+        )
+
+    def insert_person_film_work(self, conn: Optional[_connection] = None):
         """Вставляет данные из локальной таблицы person_film_work в PostgreSQL.
         """
-        with self.conn.cursor() as cursor:
-            for row in self.person_film_work:
-                line = tuple(val for val in row.values())
-                cursor.execute("""
-                INSERT INTO content.person_film_work (
-                    id,
-                    film_work_id,
-                    person_id,
-                    role,
-                    created
-                ) VALUES (%s, %s, %s, %s, %s)
-                ON CONFLICT (film_work_id, person_id, role) DO NOTHING
-                """, line)
-
-    def save_all_data(self, data: List[dict]):
-        """Основной метод, который обрабатывает данные из MySQL и загружает их в PostgreSQL.
-        """
-        for row in data:
-            film_id = self.append_film_work(row)
-
-            actor_id_list = self.append_person(row["actors"])
-            self.append_person_film_work(film_id, actor_id_list, "actor")
-
-            writer_id_list = self.append_person(row["writers"])
-            self.append_person_film_work(film_id, writer_id_list, "writer")
-
-            director_id_list = self.append_person(row["director"])
-            self.append_person_film_work(film_id, director_id_list, "director")
-
-            genre_id_list = self.append_genre(row["genre"])
-            self.append_genre_film_work(film_id, genre_id_list)
-
-        self.insert_film_work()
-        self.insert_genre()
-        self.insert_person()
-        self.insert_person_film_work()
-        self.insert_genre_film_work()
+        self._write(
+            "person_film_work", self.person_film_work, self.ON_CONFLICT["person_film_work"], conn
+        )
+
+    @staticmethod
+    def _copy_value(value: Any) -> str:
+        """Преобразует значение в поле текстового формата COPY.
+        """
+        if value is None:
+            return "\\N"
+        if isinstance(value, datetime):
+            return value.isoformat()
+        value = str(value)
+        for char, escaped in COPY_ESCAPES:
+            value = value.replace(char, escaped)
+        return value
+
+    def _copy(self, cursor: _cursor, table: str, rows: List[dict], on_conflict: str):
+        """Загружает строки одной командой COPY ... FROM STDIN. Строки сначала пишутся
+        в буфер, который остаётся в памяти, пока не превысит COPY_BUFFER_SIZE.
+
+        COPY не поддерживает ON CONFLICT, поэтому при конфликтах данные загружаются
+        во временную таблицу и уже из неё переносятся через INSERT ... SELECT.
+        """
+        columns = ", ".join(self.COLUMNS[table])
+        target = f"{self.schema}.{table}"
+        copy_into = f"tmp_{table}" if on_conflict else target
+        if on_conflict:
+            cursor.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {copy_into}
+            (LIKE {target} INCLUDING DEFAULTS) ON COMMIT DROP
+            """)
+            cursor.execute(f"TRUNCATE {copy_into}")
+
+        with SpooledTemporaryFile(max_size=COPY_BUFFER_SIZE, mode="w+") as buffer:
+            for row in rows:
+                line = "\t".join(self._copy_value(row[col]) for col in self.COLUMNS[table])
+                buffer.write(line + "\n")
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {copy_into} ({columns}) FROM STDIN", buffer)
+
+        if on_conflict:
+            cursor.execute(f"""
+            INSERT INTO {target} ({columns})
+            SELECT {columns} FROM {copy_into}
+            {on_conflict}
+            """)
+
+    def _write(
+        self,
+        table: str,
+        rows: List[dict],
+        on_conflict: str = "",
+        conn: Optional[_connection] = None
+    ):
+        """Записывает строки локальной таблицы в PostgreSQL выбранным методом:
+        copy — COPY ... FROM STDIN, values — execute_values, batch — execute_batch.
+        Для values и batch строки отправляются пачками по page_size.
+        Если соединение не передано, используется основное соединение.
+        """
+        if not rows:
+            return
+
+        columns = self.COLUMNS[table]
+        conn = self.conn if conn is None else conn
+        with conn.cursor() as cursor:
+            if self.method == "copy":
+                self._copy(cursor, table, rows, on_conflict)
+                return
+
+            lines = [tuple(row[col] for col in columns) for row in rows]
+            insert = f"INSERT INTO {self.schema}.{table} ({', '.join(columns)}) VALUES"
+            if self.method == "values":
+                execute_values(
+                    cursor, f"{insert} %s {on_conflict}", lines, page_size=self.page_size
+                )
+            else:
+                placeholders = ", ".join(["%s"] * len(columns))
+                execute_batch(
+                    cursor, f"{insert} ({placeholders}) {on_conflict}", lines,
+                    page_size=self.page_size
+                )
+
+    def preload(self):
+        """Заполняет соответствия имён и id людьми и жанрами, которые уже есть в PostgreSQL,
+        чтобы они не добавлялись повторно.
+        """
+        self.persons.load(self.conn, f"{self.schema}.person", "full_name")
+        self.genres.load(self.conn, f"{self.schema}.genre", "name")
+
+    def delete_stale_links(self, conn: Optional[_connection] = None):
+        """Удаляет связи фильмов из локальной таблицы film_work с людьми и жанрами,
+        которых больше нет в источнике.
+        """
+        film_ids = [row["id"] for row in self.film_work]
+        links = (
+            ("person_film_work", self.person_film_work),
+            ("genre_film_work", self.genre_film_work),
+        )
+        conn = self.conn if conn is None else conn
+        with conn.cursor() as cursor:
+            for table, rows in links:
+                cursor.execute(f"""
+                DELETE FROM {self.schema}.{table}
+                WHERE film_work_id = ANY(%s::uuid[]) AND id <> ALL(%s::uuid[])
+                """, (film_ids, [row["id"] for row in rows]))
+
+    def flush(self):
+        """Записывает накопленные локальные таблицы в PostgreSQL, очищает их и фиксирует
+        транзакцию. Родительские таблицы пишутся раньше таблиц связей.
+
+        Если задан writer, независимые таблицы пишутся параллельно в отдельных
+        соединениях, а контрольные суммы фиксируются последними, когда все таблицы
+        уже записаны.
+        """
+        if self.writer is None:
+            self.insert_film_work()
+            self.insert_genre()
+            self.insert_person()
+            self.delete_stale_links()
+            self.insert_person_film_work()
+            self.insert_genre_film_work()
+        else:
+            self.writer.run([
+                [self.insert_film_work, self.insert_genre, self.insert_person,
+                 self.delete_stale_links],
+                [self.insert_person_film_work, self.insert_genre_film_work],
+            ])
+
+        if self.sync_state is not None:
+            self.sync_state.save()
+        self.conn.commit()
+
+        self.film_work.clear()
+        self.genre.clear()
+        self.person.clear()
+        self.person_film_work.clear()
+        self.genre_film_work.clear()
+
+    def append_movie(self, row: Dict[str, Any]):
+        """Раскладывает один фильм из SQLiteLoader по локальным таблицам.
+        """
+        film_id = self.append_film_work(row)
+
+        actor_id_list = self.append_person(row["actors"])
+        self.append_person_film_work(film_id, actor_id_list, "actor")
+
+        writer_id_list = self.append_person(row["writers"])
+        self.append_person_film_work(film_id, writer_id_list, "writer")
+
+        director_id_list = self.append_person(row["director"])
+        self.append_person_film_work(film_id, director_id_list, "director")
+
+        genre_id_list = self.append_genre(row["genre"])
+        self.append_genre_film_work(film_id, genre_id_list)
+
+    def save_all_data(self, data: Iterable[dict]):
+        """Основной метод, который обрабатывает данные из SQLite и загружает их в PostgreSQL.
+        Данные читаются и записываются пачками по chunk_size фильмов, поэтому потребление
+        памяти не зависит от размера каталога. Запись идемпотентна: id строк детерминированы,
+        а существующие строки обновляются, поэтому загрузку можно безопасно повторять.
+        """
+        if self.sync_state is not None:
+            self.sync_state.create_table()
+
+        data = iter(data)
+        while True:
+            chunk = list(islice(data, self.chunk_size))
+            if not chunk:
+                break
+            if self.sync_state is not None:
+                chunk = self.sync_state.changed(chunk)
+
+            for row in chunk:
+                self.append_movie(row)
+            self.flush()
@@ -1,10 +1,10 @@
 import sqlite3
 import json
-from typing import List
+from typing import Iterator
 
 
 class SQLiteLoader():
-    """Загружает данные из SQLite, преобразовывает их и возвращает список словарей для
+    """Загружает данные из SQLite, преобразовывает их и отдаёт поток словарей для
     последующей обработки в PostgresSaver.
 
     Parameters
@@ -131,20 +131,27 @@ class SQLiteLoader():
 
         return new_row
 
-    def load_movies(self) -> List[dict]:
-        """Основной метод для выгрузки данных из MySQL.
+    def load_movies(self, chunk_size: int = 1000) -> Iterator[dict]:
+        """Основной метод для выгрузки данных из SQLite. Строки читаются пачками
+        через fetchmany и отдаются по одной, не накапливаясь в памяти.
 
-        Returns
+        Parameters
+        ----------
+        chunk_size : int
+            Сколько строк читать из SQLite за раз
+
+        Yields
         -------
-        List[dict]
-            Итоговые данные из БД
+        dict
+            Преобразованная строка из БД
         """
-        movies = []
-
         writers = self.load_writers_names()
 
-        for row in self.conn.execute(self.SQL):
-            transformed_row = self._transform_row(row, writers)
-            movies.append(transformed_row)
+        cursor = self.conn.execute(self.SQL)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
 
-        return movies
+            for row in rows:
+                yield self._transform_row(row, writers)
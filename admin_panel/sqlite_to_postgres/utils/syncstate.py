@@ -0,0 +1,79 @@
+import hashlib
+import json
+from datetime import datetime
+from psycopg2.extensions import connection as _connection
+from psycopg2.extras import execute_values
+
+from typing import Dict, List
+
+
+class SyncState():
+    """Контрольные суммы фильмов, уже перенесённых из SQLite. Позволяет при повторном
+    запуске пропускать фильмы, которые не изменились с прошлой загрузки.
+
+    Parameters
+    ----------
+    connection : psycopg2.extensions.connection
+        Объект соединения с PostgreSQL
+    schema : str
+        Схема, в которой хранится таблица состояния
+    """
+
+    def __init__(self, connection: _connection, schema: str = "content"):
+        self.conn = connection
+        self.table = f"{schema}.sqlite_sync_state"
+        # контрольные суммы изменившихся фильмов, которые ещё не записаны
+        self.pending: Dict[str, str] = {}
+
+    def create_table(self):
+        """Создаёт таблицу состояния, если её ещё нет.
+        """
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                source_id TEXT PRIMARY KEY,
+                checksum TEXT NOT NULL,
+                synced_at timestamp with time zone NOT NULL
+            )
+            """)
+
+    @staticmethod
+    def checksum(row: dict) -> str:
+        """Контрольная сумма строки из SQLiteLoader.
+        """
+        data = json.dumps(row, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    def changed(self, rows: List[dict]) -> List[dict]:
+        """Возвращает новые и изменившиеся фильмы из пачки и запоминает их контрольные суммы
+        до вызова save.
+        """
+        checksums = {row["id"]: self.checksum(row) for row in rows}
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT source_id, checksum FROM {self.table} WHERE source_id = ANY(%s)",
+                (list(checksums),)
+            )
+            synced = dict(cursor.fetchall())
+
+        changed = [row for row in rows if synced.get(row["id"]) != checksums[row["id"]]]
+        for row in changed:
+            self.pending[row["id"]] = checksums[row["id"]]
+
+        return changed
+
+    def save(self):
+        """Записывает контрольные суммы перенесённых фильмов. Вызывается в той же транзакции,
+        что и запись самих фильмов.
+        """
+        if not self.pending:
+            return
+
+        now = datetime.now().astimezone()
+        with self.conn.cursor() as cursor:
+            execute_values(cursor, f"""
+            INSERT INTO {self.table} (source_id, checksum, synced_at) VALUES %s
+            ON CONFLICT (source_id) DO UPDATE
+            SET checksum = EXCLUDED.checksum, synced_at = EXCLUDED.synced_at
+            """, [(source_id, checksum, now) for source_id, checksum in self.pending.items()])
+        self.pending.clear()